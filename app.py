@@ -1,20 +1,119 @@
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, make_response, g
 import os
+import re
+import json
 import time
+import asyncio
 import threading
 from collections import defaultdict
 from keyboard_predictor import KeyboardPredictor
+from layouts import active_layouts, assign_layout, get_layout, get_layouts
+import cache_warmer
+from state_store import StateStore
+import profiling
+
+try:
+    from flask_sock import Sock
+except ImportError:  # the WebSocket channel is optional; the page falls back to HTTP
+    Sock = None
 
 app = Flask(__name__)
-app.secret_key = os.urandom(24)  # For session management
+# For session management; set SECRET_KEY so sessions survive restarts and
+# are valid on every instance
+app.secret_key = os.getenv('SECRET_KEY') or os.urandom(24)
+
+# The keyboard predictor is created on first use (see get_predictor) so that
+# importing this module is fast and does not require OPENAI_API_KEY
+predictor = None
+predictor_lock = threading.Lock()
 
-# Initialize the keyboard predictor
-predictor = KeyboardPredictor()
+# Model calls run on one long-lived event loop in a background thread, so a
+# single async OpenAI client and connection pool serve every outstanding
+# prediction, whichever request (or socket) thread is waiting on it. Under
+# WSGI each of those still holds a thread; see gunicorn.conf.py
+llm_loop = None
+llm_loop_lock = threading.Lock()
 
 # Rate limiting for rapid requests
 request_times = defaultdict(list)
 rate_limit_lock = threading.Lock()
 
+# Session state is kept server-side (see state_store.py); the cookie only
+# carries the session id and revision, so its size does not grow with the text
+state_store = StateStore.from_env()
+
+# Each browser gets a long-lived user id cookie, separate from the session, so
+# the dictionary learned from its accepted words (see user_dictionary.py)
+# outlives sessions, restarts and instances
+USER_COOKIE = 'keyboard_user'
+USER_COOKIE_MAX_AGE = 2 * 365 * 86400
+USER_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+# Word predictions are kept for each prefix of the sequence being typed, so
+# backspace can restore the previous result instead of asking the model again
+MAX_PREFIX_RESULTS = 16
+
+def get_predictor():
+    """Return the shared keyboard predictor, creating it on first use"""
+    global predictor
+    if predictor is None:
+        with predictor_lock:
+            if predictor is None:
+                predictor = KeyboardPredictor()
+    return predictor
+
+def get_llm_loop():
+    """Return the background event loop for model calls, starting it on first use"""
+    global llm_loop
+    if llm_loop is None:
+        with llm_loop_lock:
+            if llm_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='llm-loop', daemon=True).start()
+                llm_loop = loop
+    return llm_loop
+
+async def on_llm_loop(coro):
+    """Run a predictor coroutine on the background loop and await its result"""
+    # carry() lets a profiled request's profile include the work done there
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(profiling.carry(coro), get_llm_loop()))
+
+def wait_on_llm_loop(coro):
+    """Run a coroutine on the background loop from synchronous code and return its result"""
+    return asyncio.run_coroutine_threadsafe(coro, get_llm_loop()).result()
+
+def warm_up(connect=True):
+    """
+    Create the predictor and build the lookup tables of every layout before
+    taking traffic; with connect, also create the OpenAI clients, including
+    the async one on the model-call loop that serves requests
+    """
+    get_predictor().warm_up(connect=connect)
+    for layout in get_layouts().values():
+        layout.warm_up()
+    if connect:
+        wait_on_llm_loop(get_predictor().awarm_up())
+
+def warm_cache():
+    """
+    Precompute word predictions for the most common button sequences of the
+    layouts in use, if WARM_CACHE_TOP is set (see cache_warmer.py). This runs
+    in the serving process, for the development server; gunicorn.conf.py
+    warms in a separate job instead
+    """
+    top_n = int(os.getenv('WARM_CACHE_TOP', '0'))
+    if top_n <= 0:
+        return
+    if get_predictor().word_cache is None:
+        print("WARM_CACHE_TOP is set but the word cache is off (set WORD_CACHE_SIZE); not warming")
+        return
+    concurrency = int(os.getenv('WARM_CACHE_CONCURRENCY', '8'))
+    contexts = cache_warmer.warm_contexts(get_predictor(), int(os.getenv('WARM_CACHE_CONTEXTS', '20')))
+    for name in active_layouts():
+        summary = cache_warmer.warm_cache(get_predictor(), name, top_n, concurrency, contexts)
+        print(f"Warmed {summary['predictions']} predictions for layout {name} "
+              f"in {summary['duration_s']}s ({summary['errors']} errors)")
+
 def is_rate_limited(session_id, max_requests=10, time_window=1.0):
     """Check if the session is rate limited"""
     with rate_limit_lock:
@@ -30,364 +129,559 @@ def is_rate_limited(session_id, max_requests=10, time_window=1.0):
         request_times[session_id].append(now)
         return False
 
+def init_state(state):
+    """Initialize state variables if not present"""
+    if 'session_id' not in state:
+        state['session_id'] = os.urandom(16).hex()
+    if 'button_sequence' not in state:
+        state['button_sequence'] = []
+    if 'top_predictions' not in state:
+        state['top_predictions'] = []
+    if 'predicted_words' not in state:
+        state['predicted_words'] = []
+    if 'next_word_predictions' not in state:
+        state['next_word_predictions'] = []
+    if 'typed_text' not in state:
+        state['typed_text'] = ""
+    if 'start_time' not in state:
+        state['start_time'] = time.time()
+    if 'word_count' not in state:
+        state['word_count'] = 0
+    if 'revision' not in state:
+        state['revision'] = 0
+    if 'prefix_results' not in state:
+        state['prefix_results'] = []
+    if state.get('layout') not in get_layouts():
+        state['layout'] = assign_layout(state['session_id'])
+
 def init_session():
-    """Initialize session variables if not present"""
-    if 'session_id' not in session:
-        session['session_id'] = os.urandom(16).hex()
-    if 'button_sequence' not in session:
-        session['button_sequence'] = []
-    if 'top_predictions' not in session:
-        session['top_predictions'] = []
-    if 'predicted_words' not in session:
-        session['predicted_words'] = []
-    if 'next_word_predictions' not in session:
-        session['next_word_predictions'] = []
-    if 'typed_text' not in session:
-        session['typed_text'] = ""
-    if 'start_time' not in session:
-        session['start_time'] = time.time()
-    if 'word_count' not in session:
-        session['word_count'] = 0
+    """
+    Load this request's session state (a new one if there is none); it is
+    saved after the request if it changed. A state that was lost (expired,
+    or the server restarted without STATE_DIR) starts again from the
+    cookie's revision, so a client never mistakes the new state for its own.
+    """
+    if 'state' not in g:
+        state = state_store.get(session.get('session_id'))
+        g.stored_state = state
+        if state is None:
+            # Older cookies carried the whole state; pick it up once
+            state = {key: value for key, value in session.items() if not key.startswith('_')}
+        else:
+            state = dict(state)
+        init_state(state)
+        state['user_id'] = current_user_id(state)
+        g.state = state
+    return g.state
+
+def current_user_id(state):
+    """Return the user id from the user cookie, issuing the cookie if it is missing"""
+    user_id = request.cookies.get(USER_COOKIE, '')
+    if not USER_ID_RE.match(user_id):
+        user_id = state.get('user_id') or os.urandom(16).hex()
+        g.issue_user_id = user_id
+    return user_id
+
+def save_state(state):
+    """Store a session's state and point the cookie at it"""
+    state_store.put(state)
+    if set(session) - {'session_id', 'revision'}:
+        session.clear()
+    if session.get('session_id') != state['session_id']:
+        session['session_id'] = state['session_id']
+    if session.get('revision') != state['revision']:
+        session['revision'] = state['revision']
+
+@app.after_request
+def save_session(response):
+    """Save the state loaded by init_session() if the request changed it"""
+    if 'state' in g and g.state != g.stored_state:
+        save_state(g.state)
+    if 'issue_user_id' in g:
+        response.set_cookie(USER_COOKIE, g.issue_user_id, max_age=USER_COOKIE_MAX_AGE,
+                            httponly=True, samesite='Lax')
+    return response
+
+def current_state(state):
+    """Snapshot of the session state that is sent to the client"""
+    return {
+        'top_predictions': list(state['top_predictions']),
+        'alternative_words': list(state['predicted_words']),
+        'next_word_predictions': list(state['next_word_predictions']),
+        'button_sequence': list(state['button_sequence']),
+        'typed_text': state['typed_text'],
+        'word_count': state['word_count'],
+        'layout': state['layout'],
+    }
+
+def state_etag(state):
+    """ETag identifying the current revision of a session's state"""
+    return f"{state['session_id']}-{state['revision']}"
+
+def state_body(state, before, delta):
+    """
+    Build the client payload for `state`.
+
+    `before` is the snapshot taken before the change; if the state differs
+    from it, the revision is bumped. With `delta`, only the fields that
+    changed are included (text appended to typed_text is sent as
+    typed_text_append) and the payload is marked with 'delta': true.
+    """
+    snapshot = current_state(state)
+    if snapshot != before:
+        state['revision'] += 1
+
+    if delta:
+        body = {key: value for key, value in snapshot.items() if before[key] != value}
+        if 'typed_text' in body and body['typed_text'].startswith(before['typed_text']):
+            body['typed_text_append'] = body.pop('typed_text')[len(before['typed_text']):]
+        body['delta'] = True
+    else:
+        body = snapshot
+
+    # Calculate performance metrics
+    elapsed_time = time.time() - state['start_time']
+    wpm = (state['word_count'] / (elapsed_time / 60)) if elapsed_time > 0 else 0
+    body['elapsed_time'] = round(elapsed_time, 1)
+    body['wpm'] = round(wpm, 1)
+    body['revision'] = state['revision']
+    return body
+
+def state_response(state, before):
+    """
+    Build the JSON response for a session state.
+
+    Clients that send the revision they hold in X-State-Revision get only the
+    fields that changed since `before`. Every response carries the revision
+    and an ETag.
+    """
+    known_revision = request.headers.get('X-State-Revision', type=int)
+    delta = known_revision is not None and known_revision == state['revision']
+    response = jsonify(state_body(state, before, delta))
+    response.set_etag(state_etag(state))
+    return response
+
+# State transitions shared by the HTTP routes and the WebSocket channel
+
+async def update_word_predictions(state):
+    """Predict words for the current button sequence"""
+    if state['button_sequence']:
+        result = await on_llm_loop(get_predictor().apredict_word(
+            state['button_sequence'], state['typed_text'], state['user_id'], state['layout'],
+            state['session_id']))
+        state['top_predictions'] = result.get('top_predictions', [])
+        state['predicted_words'] = result.get('alternative_words', [])
+        remember_prefix_result(state)
+    else:
+        state['top_predictions'] = []
+        state['predicted_words'] = []
+
+async def update_next_words(state):
+    """Predict the next words for the current typed text"""
+    next_words = []
+    if state['typed_text'].strip():  # Only predict next words if there's existing text
+        next_words = await on_llm_loop(get_predictor().apredict_next_words(
+            state['typed_text'], "", state['session_id']))
+    state['next_word_predictions'] = next_words
+
+def append_word(state, word):
+    """Add an accepted word to the typed text and reset for the next word"""
+    get_predictor().learn_word(state['user_id'], word, state['typed_text'])
+    if state['typed_text']:
+        state['typed_text'] += " " + word
+    else:
+        state['typed_text'] = word
+
+    state['button_sequence'] = []
+    state['top_predictions'] = []
+    state['predicted_words'] = []
+    state['prefix_results'] = []
+    state['word_count'] += 1
+
+def remember_prefix_result(state):
+    """Store the current word predictions as the result for the current sequence"""
+    depth = len(state['button_sequence'])
+    if depth > MAX_PREFIX_RESULTS:
+        return
+    results = state['prefix_results'][:depth - 1]
+    results += [None] * (depth - 1 - len(results))
+    results.append([state['top_predictions'], state['predicted_words']])
+    state['prefix_results'] = results
+
+def apply_press(state, button_num):
+    """Add a button to the sequence"""
+    state['prefix_results'] = state['prefix_results'][:len(state['button_sequence'])]
+    state['button_sequence'] = state['button_sequence'] + [button_num]
+
+def apply_backspace(state):
+    """
+    Remove the last button from the sequence and restore the predictions
+    stored for the shorter sequence. Returns True if there were none, so the
+    word predictions must be recomputed.
+    """
+    if not state['button_sequence']:
+        return False
+    state['button_sequence'] = state['button_sequence'][:-1]
+    depth = len(state['button_sequence'])
+    state['prefix_results'] = state['prefix_results'][:depth]
+
+    if depth == 0:
+        state['top_predictions'] = []
+        state['predicted_words'] = []
+        return False
+    if depth <= len(state['prefix_results']) and state['prefix_results'][depth - 1] is not None:
+        state['top_predictions'], state['predicted_words'] = state['prefix_results'][depth - 1]
+        return False
+    return True
+
+async def update_all_predictions(state):
+    """Predict the current word and the next words concurrently"""
+    await asyncio.gather(update_word_predictions(state), update_next_words(state))
+
+async def apply_accept(state, word=None):
+    """Accept `word`, or the top prediction if no word is given"""
+    # If no word provided, use the first top prediction
+    if not word and state['top_predictions']:
+        word = state['top_predictions'][0]
+
+    if word:
+        append_word(state, word)
+        await update_next_words(state)
+
+async def apply_space(state):
+    """Accept the top prediction, or add a plain space if there is none"""
+    if state['top_predictions']:
+        append_word(state, state['top_predictions'][0])
+    elif state['typed_text']:
+        state['typed_text'] += ' '
+    await update_next_words(state)
+
+async def apply_next_word(state, word):
+    """Add a suggested next word to the typed text"""
+    if word:
+        append_word(state, word)
+        await update_next_words(state)
+
+def apply_new_word(state):
+    """Clear the current sequence and predictions"""
+    state['button_sequence'] = []
+    state['top_predictions'] = []
+    state['predicted_words'] = []
+    state['prefix_results'] = []
+    state['next_word_predictions'] = []
+
+def apply_clear(state):
+    """Clear everything and start over"""
+    apply_new_word(state)
+    state['typed_text'] = ""
+    state['start_time'] = time.time()
+    state['word_count'] = 0
+
+def apply_layout(state, name):
+    """Switch the session to another layout, dropping the word in progress"""
+    if name != state['layout']:
+        apply_new_word(state)
+        state['layout'] = name
 
 @app.route('/')
 def index():
-    """Main page with the keyboard interface"""
-    init_session()
-    return render_template('index.html')
+    """Main page with the keyboard interface; ?layout=<name> switches this session's layout"""
+    state = init_session()
+    before = current_state(state)
+    requested = request.args.get('layout')
+    if requested in get_layouts():
+        apply_layout(state, requested)
+    if current_state(state) != before:
+        state['revision'] += 1
+    return render_template('index.html', websocket_enabled=Sock is not None,
+                           layout=get_layout(state['layout']))
+
+@app.route('/layout_index', methods=['GET'])
+def layout_index():
+    """Top words per button key for the session's layout, for instant client-side predictions"""
+    try:
+        name = request.args.get('layout') or init_session()['layout']
+        if name is not None and name not in get_layouts():
+            return jsonify({'error': 'Unknown layout'}), 404
+        top_n = min(max(request.args.get('top', 5, type=int), 1), 10)
+        body, etag = get_layout(name).client_index(top_n)
+        
+        response = make_response(body)
+        response.mimetype = 'application/json'
+        response.set_etag(etag)
+        response.cache_control.no_cache = True  # always revalidate; unchanged indexes cost a 304
+        response.vary.add('Cookie')  # the layout follows the session
+        return response.make_conditional(request)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/press_button', methods=['POST'])
-def press_button():
+async def press_button():
     """Handle button press and return AI prediction"""
     try:
-        init_session()
+        state = init_session()
+        before = current_state(state)
         
         # Rate limiting check
-        session_id = session.get('session_id', id(session))
+        session_id = state['session_id']
         if is_rate_limited(session_id):
             return jsonify({'error': 'Too many requests, please slow down'}), 429
         
         data = request.get_json()
         if not data:
             return jsonify({'error': 'No data provided'}), 400
-            
+        
         button_num = data.get('button')
         
-        if button_num not in [1, 2, 3, 4, 5, 6]:
+        if not get_layout(state['layout']).is_button(button_num):
             return jsonify({'error': 'Invalid button number'}), 400
         
-        # Add button to sequence
-        session['button_sequence'].append(button_num)
-        
-        # Get prediction from AI with context
-        result = predictor.predict_word(session['button_sequence'], session['typed_text'])
-        session['top_predictions'] = result.get('top_predictions', [])
-        session['predicted_words'] = result.get('alternative_words', [])
-        
-        # Get next word predictions based on current typed text
-        next_words = []
-        if session['typed_text'].strip():  # Only predict next words if there's existing text
-            next_words = predictor.predict_next_words(session['typed_text'], "")
-        session['next_word_predictions'] = next_words
-        
-        # Calculate performance metrics
-        elapsed_time = time.time() - session['start_time']
-        wpm = (session['word_count'] / (elapsed_time / 60)) if elapsed_time > 0 else 0
-        
-        return jsonify({
-            'top_predictions': session['top_predictions'],
-            'alternative_words': session['predicted_words'],
-            'next_word_predictions': session['next_word_predictions'],
-            'button_sequence': session['button_sequence'],
-            'typed_text': session['typed_text'],
-            'word_count': session['word_count'],
-            'elapsed_time': round(elapsed_time, 1),
-            'wpm': round(wpm, 1)
-        })
+        apply_press(state, button_num)
+        await update_all_predictions(state)
         
+        return state_response(state, before)
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/accept_word', methods=['POST'])
-def accept_word():
+async def accept_word():
     """Accept the current predicted word"""
     try:
-        init_session()
+        state = init_session()
+        before = current_state(state)
         
         data = request.get_json()
-        word = data.get('word')
-        
-        # If no word provided, use the first top prediction
-        if not word and session['top_predictions']:
-            word = session['top_predictions'][0]
-        
-        if word:
-            # Add word to typed text
-            if session['typed_text']:
-                session['typed_text'] += " " + word
-            else:
-                session['typed_text'] = word
-            
-            # Reset for next word
-            session['button_sequence'] = []
-            session['top_predictions'] = []
-            session['predicted_words'] = []
-            session['word_count'] += 1
-            
-            # Generate next word predictions based on new text
-            next_words = []
-            if session['typed_text'].strip():
-                next_words = predictor.predict_next_words(session['typed_text'], "")
-            session['next_word_predictions'] = next_words
-        
-        # Calculate performance metrics
-        elapsed_time = time.time() - session['start_time']
-        wpm = (session['word_count'] / (elapsed_time / 60)) if elapsed_time > 0 else 0
-        
-        return jsonify({
-            'top_predictions': session['top_predictions'],
-            'alternative_words': session['predicted_words'],
-            'next_word_predictions': session['next_word_predictions'],
-            'button_sequence': session['button_sequence'],
-            'typed_text': session['typed_text'],
-            'word_count': session['word_count'],
-            'elapsed_time': round(elapsed_time, 1),
-            'wpm': round(wpm, 1)
-        })
+        await apply_accept(state, data.get('word'))
         
+        return state_response(state, before)
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/backspace', methods=['POST'])
-def backspace():
+async def backspace():
     """Remove last button press - instant response"""
     try:
-        init_session()
-        
-        # Remove last button from sequence
-        if session['button_sequence']:
-            session['button_sequence'].pop()
-            
-            if session['button_sequence']:
-                # Re-predict with remaining sequence and context
-                result = predictor.predict_word(session['button_sequence'], session['typed_text'])
-                session['top_predictions'] = result.get('top_predictions', [])
-                session['predicted_words'] = result.get('alternative_words', [])
-            else:
-                # If no sequence left, clear predictions
-                session['top_predictions'] = []
-                session['predicted_words'] = []
-                
-        # Update next word predictions based on current text
-        next_words = []
-        if session['typed_text'].strip():
-            next_words = predictor.predict_next_words(session['typed_text'], "")
-        session['next_word_predictions'] = next_words
-        
-        # Calculate performance metrics
-        elapsed_time = time.time() - session['start_time']
-        wpm = (session['word_count'] / (elapsed_time / 60)) if elapsed_time > 0 else 0
+        state = init_session()
+        before = current_state(state)
         
-        return jsonify({
-            'top_predictions': session['top_predictions'],
-            'alternative_words': session['predicted_words'],
-            'next_word_predictions': session['next_word_predictions'],
-            'button_sequence': session['button_sequence'],
-            'typed_text': session['typed_text'],
-            'word_count': session['word_count'],
-            'elapsed_time': round(elapsed_time, 1),
-            'wpm': round(wpm, 1)
-        })
+        # The typed text is unchanged, so next-word predictions still hold;
+        # word predictions come from the prefix stack when available
+        if apply_backspace(state):
+            await update_word_predictions(state)
+        elif not state['button_sequence'] and not state['next_word_predictions']:
+            await update_next_words(state)
         
+        return state_response(state, before)
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/new_word', methods=['POST'])
-def new_word():
+async def new_word():
     """Start a new word (clear current sequence)"""
     try:
-        init_session()
+        state = init_session()
+        before = current_state(state)
         
         # Rate limiting check
-        session_id = session.get('session_id', id(session))
+        session_id = state['session_id']
         if is_rate_limited(session_id):
             return jsonify({'error': 'Too many requests, please slow down'}), 429
         
-        session['button_sequence'] = []
-        session['top_predictions'] = []
-        session['predicted_words'] = []
-        session['next_word_predictions'] = []
-        
-        # Calculate performance metrics
-        elapsed_time = time.time() - session['start_time']
-        wpm = (session['word_count'] / (elapsed_time / 60)) if elapsed_time > 0 else 0
-        
-        return jsonify({
-            'top_predictions': session['top_predictions'],
-            'alternative_words': session['predicted_words'],
-            'next_word_predictions': session['next_word_predictions'],
-            'button_sequence': session['button_sequence'],
-            'typed_text': session['typed_text'],
-            'word_count': session['word_count'],
-            'elapsed_time': round(elapsed_time, 1),
-            'wpm': round(wpm, 1)
-        })
+        apply_new_word(state)
         
+        return state_response(state, before)
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/add_space', methods=['POST'])
-def add_space():
+async def add_space():
     """Add space - same functionality as accept word"""
     try:
-        init_session()
+        state = init_session()
+        before = current_state(state)
         
-        # If there's a current prediction, accept it
-        if session['top_predictions']:
-            word = session['top_predictions'][0]
-            
-            # Add word to typed text
-            if session['typed_text']:
-                session['typed_text'] += " " + word
-            else:
-                session['typed_text'] = word
-            
-            # Reset for next word
-            session['button_sequence'] = []
-            session['top_predictions'] = []
-            session['predicted_words'] = []
-            session['word_count'] += 1
-        else:
-            # If no prediction, just add space
-            if session['typed_text']:
-                session['typed_text'] += ' '
-        
-        # Generate next word predictions based on updated text
-        next_words = []
-        if session['typed_text'].strip():
-            next_words = predictor.predict_next_words(session['typed_text'], "")
-        session['next_word_predictions'] = next_words
-        
-        # Calculate performance metrics
-        elapsed_time = time.time() - session['start_time']
-        wpm = (session['word_count'] / (elapsed_time / 60)) if elapsed_time > 0 else 0
-        
-        return jsonify({
-            'top_predictions': session['top_predictions'],
-            'alternative_words': session['predicted_words'],
-            'next_word_predictions': session['next_word_predictions'],
-            'button_sequence': session['button_sequence'],
-            'typed_text': session['typed_text'],
-            'word_count': session['word_count'],
-            'elapsed_time': round(elapsed_time, 1),
-            'wpm': round(wpm, 1)
-        })
+        await apply_space(state)
         
+        return state_response(state, before)
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/add_next_word', methods=['POST'])
-def add_next_word():
+async def add_next_word():
     """Add a suggested next word to the typed text"""
     try:
-        init_session()
+        state = init_session()
+        before = current_state(state)
         
         data = request.get_json()
-        word = data.get('word')
-        
-        if word:
-            # Add word to typed text
-            if session['typed_text']:
-                session['typed_text'] += " " + word
-            else:
-                session['typed_text'] = word
-            
-            # Clear current word predictions but keep next word suggestions
-            session['button_sequence'] = []
-            session['top_predictions'] = []
-            session['predicted_words'] = []
-            session['word_count'] += 1
-            
-            # Update next word predictions based on new text
-            next_words = []
-            if session['typed_text'].strip():
-                next_words = predictor.predict_next_words(session['typed_text'], "")
-            session['next_word_predictions'] = next_words
-        
-        # Calculate performance metrics
-        elapsed_time = time.time() - session['start_time']
-        wpm = (session['word_count'] / (elapsed_time / 60)) if elapsed_time > 0 else 0
-        
-        return jsonify({
-            'top_predictions': session['top_predictions'],
-            'alternative_words': session['predicted_words'],
-            'next_word_predictions': session['next_word_predictions'],
-            'button_sequence': session['button_sequence'],
-            'typed_text': session['typed_text'],
-            'word_count': session['word_count'],
-            'elapsed_time': round(elapsed_time, 1),
-            'wpm': round(wpm, 1)
-        })
+        await apply_next_word(state, data.get('word'))
         
+        return state_response(state, before)
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/clear_all', methods=['POST'])
-def clear_all():
+async def clear_all():
     """Clear everything and start over"""
     try:
-        init_session()
+        state = init_session()
+        before = current_state(state)
         
         # Rate limiting check
-        session_id = session.get('session_id', id(session))
+        session_id = state['session_id']
         if is_rate_limited(session_id):
             return jsonify({'error': 'Too many requests, please slow down'}), 429
         
-        # Initialize and clear all session variables
-        session['button_sequence'] = []
-        session['top_predictions'] = []
-        session['predicted_words'] = []
-        session['next_word_predictions'] = []
-        session['typed_text'] = ""
-        session['start_time'] = time.time()
-        session['word_count'] = 0
-        
-        return jsonify({
-            'top_predictions': session['top_predictions'],
-            'alternative_words': session['predicted_words'],
-            'next_word_predictions': session['next_word_predictions'],
-            'button_sequence': session['button_sequence'],
-            'typed_text': session['typed_text'],
-            'word_count': session['word_count'],
-            'elapsed_time': 0.0,
-            'wpm': 0.0
-        })
+        apply_clear(state)
         
+        return state_response(state, before)
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/get_state', methods=['GET'])
-def get_state():
-    """Get current application state"""
+async def get_state():
+    """Get current application state; answers 304 if the client's revision is current"""
     try:
-        init_session()
-        
-        # Calculate performance metrics
-        elapsed_time = time.time() - session.get('start_time', time.time())
-        wpm = (session.get('word_count', 0) / (elapsed_time / 60)) if elapsed_time > 0 else 0
+        state = init_session()
         
-        return jsonify({
-            'top_predictions': session.get('top_predictions', []),
-            'alternative_words': session.get('predicted_words', []),
-            'next_word_predictions': session.get('next_word_predictions', []),
-            'button_sequence': session.get('button_sequence', []),
-            'typed_text': session.get('typed_text', ''),
-            'word_count': session.get('word_count', 0),
-            'elapsed_time': round(elapsed_time, 1),
-            'wpm': round(wpm, 1)
-        })
+        if request.if_none_match.contains(state_etag(state)):
+            response = app.response_class(status=304)
+            response.set_etag(state_etag(state))
+            return response
         
+        return state_response(state, current_state(state))
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Actions accepted over the WebSocket channel, with whether they read the
+# current word predictions (which may be stale while presses are batched)
+SOCKET_ACTIONS = {
+    'press': False,
+    'backspace': False,
+    'accept': True,
+    'space': True,
+    'next_word': False,
+    'new_word': False,
+    'clear': False,
+    'state': False,
+}
+
+if Sock is not None:
+    sock = Sock(app)
+
+    @sock.route('/ws')
+    def keystroke_channel(ws):
+        """
+        Persistent keystroke channel.
+        
+        The client sends small JSON messages such as {"action": "press",
+        "button": 3}; the server pushes {"type": "state", ...} updates: first
+        the new sequence, then the word predictions and the next-word
+        predictions as each becomes ready. Messages that arrive while a
+        prediction is running are applied together, so only the latest
+        sequence is predicted. Changes are saved to the state store as they
+        are pushed, so the page's HTTP requests see them too.
+        """
+        state = init_session()
+        g.pop('state')  # saved by push() below, not after the request
+        state_store.put(state)
+        sent = current_state(state)  # snapshot of what this connection last pushed
+        send_full = True
+
+        def push():
+            nonlocal sent, send_full
+            if not send_full and current_state(state) == sent:
+                return
+            body = state_body(state, sent, delta=not send_full)
+            body['type'] = 'state'
+            ws.send(json.dumps(body))
+            sent = current_state(state)
+            send_full = False
+            state_store.put(state)
+        
+        push()
+        while True:
+            batch = [ws.receive()]
+            while True:
+                message = ws.receive(timeout=0)
+                if message is None:
+                    break
+                batch.append(message)
+            
+            # Pick up changes made over HTTP since the last push (the store is
+            # shared by every worker, so it does not matter which served them)
+            state = state_store.get(state['session_id']) or state
+            
+            predictions_stale = False
+            for raw in batch:
+                try:
+                    message = json.loads(raw)
+                    action = message.get('action')
+                    if action not in SOCKET_ACTIONS:
+                        raise ValueError(f"Unknown action: {action}")
+                    
+                    if SOCKET_ACTIONS[action] and predictions_stale:
+                        wait_on_llm_loop(update_word_predictions(state))
+                        predictions_stale = False
+                    
+                    if action == 'press':
+                        if not get_layout(state['layout']).is_button(message.get('button')):
+                            raise ValueError('Invalid button number')
+                        apply_press(state, message['button'])
+                        predictions_stale = True
+                    elif action == 'backspace':
+                        predictions_stale = apply_backspace(state)
+                    elif action == 'accept':
+                        wait_on_llm_loop(apply_accept(state, message.get('word')))
+                    elif action == 'space':
+                        wait_on_llm_loop(apply_space(state))
+                    elif action == 'next_word':
+                        wait_on_llm_loop(apply_next_word(state, message.get('word')))
+                    elif action == 'new_word':
+                        apply_new_word(state)
+                        predictions_stale = False
+                    elif action == 'clear':
+                        apply_clear(state)
+                        predictions_stale = False
+                    elif action == 'state':
+                        send_full = True
+                except Exception as e:
+                    ws.send(json.dumps({'type': 'error', 'error': str(e)}))
+            
+            push()
+            if predictions_stale:
+                try:
+                    wait_on_llm_loop(update_word_predictions(state))
+                    push()
+                    wait_on_llm_loop(update_next_words(state))
+                    push()
+                except Exception as e:
+                    ws.send(json.dumps({'type': 'error', 'error': str(e)}))
+
+# Opt-in request profiling (PROFILING=1); a no-op otherwise
+profiling.install(app, exclude=('static', 'keystroke_channel'))
+
+@app.cli.command('warm-up')
+def warm_up_command():
+    """Build the predictor and its lookup tables, then exit"""
+    start = time.perf_counter()
+    warm_up()
+    print(f"Warm-up finished in {(time.perf_counter() - start) * 1000:.1f} ms")
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    debug = True
+    # The debug reloader runs this script twice: a parent that only watches
+    # files and the child that serves. Only the child needs warming up.
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        warm_up()
+        warm_cache()
+    app.run(host='0.0.0.0', port=5000, debug=debug)
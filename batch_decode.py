@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Batch decoder: run many (button_sequence, context) records through KeyboardPredictor
+
+Input is JSONL (one object per line) or CSV (with a header row). Each record
+needs a `button_sequence` (a list of ints, "2 4 1", "2,4,1" or "241") and may
+have a `context` and an `id`, which is passed through. Results are written as
+JSONL in input order while later records are still being decoded.
+
+Engines:
+    local  dictionary/lexicon lookups only, fanned out over a process pool
+    llm    the full predictor, with a bounded number of concurrent model calls
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from keyboard_predictor import KeyboardPredictor
+
+
+def parse_sequence(value):
+    """Parse a button sequence given as a list or a string"""
+    if isinstance(value, list):
+        return [int(b) for b in value]
+    text = str(value).strip()
+    parts = re.split(r"[\s,]+", text) if re.search(r"[\s,]", text) else list(text)
+    return [int(b) for b in parts if b]
+
+
+def read_records(path):
+    """Yield records from a JSONL or CSV file ('-' reads JSONL from stdin)"""
+    if path == "-":
+        lines = sys.stdin
+    elif path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            yield from csv.DictReader(f)
+        return
+    else:
+        lines = open(path, encoding="utf-8")
+
+    try:
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+
+
+def _result(record, prediction=None, error=None):
+    result = {
+        "button_sequence": record.get("button_sequence"),
+        "context": record.get("context") or "",
+    }
+    if "id" in record:
+        result["id"] = record["id"]
+    if error is not None:
+        result["error"] = error
+    else:
+        result.update(prediction)
+    return result
+
+
+# Local engine: one predictor per worker process
+
+_worker_predictor = None
+
+
+def _decode_local_chunk(records):
+    global _worker_predictor
+    if _worker_predictor is None:
+        _worker_predictor = KeyboardPredictor()
+
+    results = []
+    for record in records:
+        try:
+            sequence = parse_sequence(record["button_sequence"])
+            prediction = _worker_predictor.predict_word_local(sequence, record.get("context") or "")
+            results.append(_result(record, prediction))
+        except Exception as e:
+            results.append(_result(record, error=str(e)))
+    return results
+
+
+def _chunks(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def decode_local(records, workers=None, chunk_size=256):
+    """Decode records with local lookups across a process pool, yielding results in input order"""
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in _chunks(records, chunk_size):
+            pending.append(pool.submit(_decode_local_chunk, chunk))
+            # Keep a bounded number of chunks in flight so large inputs stream
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+# LLM engine: bounded concurrent model calls on one event loop
+
+async def adecode_llm(records, predictor=None, concurrency=16):
+    """Decode records with the full predictor, yielding results in input order"""
+    predictor = predictor or KeyboardPredictor()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def decode(record):
+        async with semaphore:
+            try:
+                sequence = parse_sequence(record["button_sequence"])
+                prediction = await predictor.apredict_word(sequence, record.get("context") or "")
+                return _result(record, prediction)
+            except Exception as e:
+                return _result(record, error=str(e))
+
+    pending = deque()
+    for record in records:
+        pending.append(asyncio.ensure_future(decode(record)))
+        if len(pending) >= concurrency * 2:
+            yield await pending.popleft()
+    while pending:
+        yield await pending.popleft()
+
+
+def decode_llm(records, predictor=None, concurrency=16):
+    """Synchronous wrapper around adecode_llm"""
+    loop = asyncio.new_event_loop()
+    results = adecode_llm(records, predictor, concurrency)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(results.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(results.aclose())
+        loop.close()
+
+
+def decode_records(records, engine="llm", workers=None, concurrency=16, predictor=None):
+    """Decode an iterable of records with the given engine, yielding results in input order"""
+    if engine == "local":
+        return decode_local(records, workers=workers)
+    if engine == "llm":
+        return decode_llm(records, predictor=predictor, concurrency=concurrency)
+    raise ValueError(f"Unknown engine: {engine}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("input", help="JSONL or CSV file of records ('-' for JSONL on stdin)")
+    parser.add_argument("-o", "--output", help="write JSONL results here instead of stdout")
+    parser.add_argument("--engine", choices=["local", "llm"], default="llm")
+    parser.add_argument("--workers", type=int, help="processes for the local engine (default: CPU count)")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent model calls for the llm engine")
+    args = parser.parse_args()
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    start = time.perf_counter()
+    count = errors = 0
+    try:
+        for result in decode_records(read_records(args.input), args.engine, args.workers, args.concurrency):
+            out.write(json.dumps(result) + "\n")
+            count += 1
+            errors += "error" in result
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else 0
+    print(f"Decoded {count} records ({errors} errors) in {elapsed:.2f}s ({rate:.0f}/s)", file=sys.stderr)
@@ -1,9 +1,29 @@
 #!/usr/bin/env python3
 """
 Benchmark helper for testing keyboard predictor accuracy
+
+Maps a text corpus through the active button layout into (sequence, context,
+expected word) cases, runs a predictor over them and reports accuracy,
+keystroke cost, model usage and wall time, optionally as JSON for comparing
+runs.
 """
 
+import argparse
+import json
+import os
+import re
+import time
+
 from keyboard_predictor import KeyboardPredictor
+from layouts import get_layout
+from llm_clients import CountingClient, LexiconMockClient
+from sequence_index import letter_map, word_key
+
+# Quick sanity words for --sample; their sequences are derived from the layout
+SAMPLE_WORDS = ["THERE", "EL", "MAN", "CZECH", "THE", "AND", "HE", "IS", "TO", "IN"]
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "benchmark_corpus.txt")
+
 
 def benchmark(seq_list, predictor=None):
     """
@@ -44,23 +64,145 @@ def benchmark(seq_list, predictor=None):
     print(f"Top-1 accuracy: {accuracy:.3f} ({hits}/{total})")
     return accuracy
 
+
+def sequences_for_words(words, groups):
+    """Return (button_sequence, word) pairs for words under a layout"""
+    letters_to_buttons = letter_map(groups)
+    return [(list(word_key(w.upper(), letters_to_buttons)), w.upper()) for w in words]
+
+
+def generate_cases(text, groups, context_words=8):
+    """
+    Turn corpus text into benchmark cases for a layout.
+
+    Each word becomes {"sequence", "context", "word"}, where the context is
+    the preceding `context_words` words of the same paragraph, as a user
+    would have typed them. Words that cannot be typed on the layout are
+    skipped but still count as context.
+    """
+    letters_to_buttons = letter_map(groups)
+    cases = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        history = []
+        for token in paragraph.split():
+            word = re.sub(r"[^A-Za-z]", "", token).upper()
+            if not word:
+                continue
+            key = word_key(word, letters_to_buttons)
+            if key:
+                cases.append({
+                    "sequence": list(key),
+                    "context": " ".join(history[-context_words:]),
+                    "word": word,
+                })
+            history.append(token)
+    return cases
+
+
+def make_predictor(mode, layout=None):
+    """Return (predictor, counting client or None) for mode 'mock', 'local' or 'live'"""
+    if mode == "live":
+        predictor = KeyboardPredictor(layout=layout)
+        counter = CountingClient(predictor.client)
+    elif mode == "mock":
+        predictor = KeyboardPredictor(layout=layout)
+        counter = CountingClient(LexiconMockClient(predictor.groups))
+    elif mode == "local":
+        return KeyboardPredictor(layout=layout), None
+    else:
+        raise ValueError(f"Unknown mode: {mode}")
+    predictor._client = counter
+    return predictor, counter
+
+
+def run_corpus_benchmark(cases, mode="mock", verbose=False, layout=None):
+    """
+    Run cases through a predictor and return a metrics dict.
+
+    Keystrokes per character counts the button presses plus one selection per
+    word, over the word's letters plus its trailing space. A word that is not
+    among the shown candidates (top 3 plus alternatives) is charged a
+    spelling penalty of one extra keystroke per letter.
+    """
+    predictor, counter = make_predictor(mode, layout)
+    top1 = top3 = shown = errors = keystrokes = characters = 0
+
+    start = time.perf_counter()
+    for case in cases:
+        try:
+            if mode == "local":
+                result = predictor.predict_word_local(case["sequence"], case["context"])
+            else:
+                result = predictor.predict_word(case["sequence"], case["context"])
+        except Exception as e:
+            errors += 1
+            result = {"top_predictions": [], "alternative_words": []}
+            if verbose:
+                print(f"✗ {case['word']}: error: {e}")
+
+        candidates = result.get("top_predictions", []) + result.get("alternative_words", [])
+        hit1 = candidates[:1] == [case["word"]]
+        top1 += hit1
+        top3 += case["word"] in candidates[:3]
+        shown += case["word"] in candidates
+
+        keystrokes += len(case["sequence"]) + 1
+        if case["word"] not in candidates:
+            keystrokes += len(case["word"])
+        characters += len(case["word"]) + 1
+
+        if verbose:
+            print(f"{'✓' if hit1 else '✗'} {case['word']:<12} -> {', '.join(candidates[:3]) or 'NO_PRED'}")
+    wall_time = time.perf_counter() - start
+
+    total = len(cases) or 1
+    return {
+        "mode": mode,
+        "layout": predictor.layout.name,
+        "words": len(cases),
+        "top1_accuracy": round(top1 / total, 4),
+        "top3_accuracy": round(top3 / total, 4),
+        "shown_accuracy": round(shown / total, 4),
+        "keystrokes_per_char": round(keystrokes / (characters or 1), 4),
+        "llm_calls_per_word": round(counter.calls / total, 3) if counter else 0.0,
+        "tokens_per_word": round(counter.total_tokens / total, 1) if counter else 0.0,
+        "errors": errors,
+        "wall_time_s": round(wall_time, 3),
+        "ms_per_word": round(wall_time * 1000 / total, 3),
+    }
+
+
 if __name__ == "__main__":
-    # Sample test cases
-    test_cases = [
-        ([2, 4, 1, 2, 1], "THERE"),
-        ([1, 1], "EL"), 
-        ([6, 3, 6], "MAN"),
-        ([2, 1, 2, 1, 3], "CZECH"),
-        ([2, 4, 1], "THE"),
-        ([3, 6, 3], "AND"),
-        ([4, 1], "HE"),
-        ([5, 2], "IS"),
-        ([2, 4], "TO"),
-        ([5, 6], "IN")
-    ]
-    
-    # Run benchmark
-    kp = KeyboardPredictor()
-    accuracy = benchmark(test_cases, kp)
-    
-    print(f"\nFinal accuracy: {accuracy:.1%}")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Corpus-driven keyboard predictor benchmark")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="text file to generate cases from")
+    parser.add_argument("--mode", choices=["mock", "local", "live"], default="mock",
+                        help="mock: simulated model, local: no model, live: OpenAI API")
+    parser.add_argument("--layout", help="layout name from layouts.py (default: KEYBOARD_LAYOUT)")
+    parser.add_argument("--limit", type=int, help="only run the first N cases")
+    parser.add_argument("--context-words", type=int, default=8, help="words of preceding context per case")
+    parser.add_argument("--json", metavar="PATH", help="also write the metrics as JSON to PATH")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every case")
+    parser.add_argument("--sample", action="store_true", help="run the quick SAMPLE_WORDS check against the live API")
+    args = parser.parse_args()
+
+    if args.sample:
+        kp = KeyboardPredictor()
+        accuracy = benchmark(sequences_for_words(SAMPLE_WORDS, kp.groups), kp)
+        print(f"\nFinal accuracy: {accuracy:.1%}")
+        raise SystemExit(0)
+
+    with open(args.corpus, encoding="utf-8") as f:
+        cases = generate_cases(f.read(), get_layout(args.layout).groups, args.context_words)
+    if args.limit:
+        cases = cases[:args.limit]
+
+    metrics = run_corpus_benchmark(cases, args.mode, args.verbose, args.layout)
+    metrics["corpus"] = os.path.basename(args.corpus)
+
+    print("-" * 50)
+    for name, value in metrics.items():
+        print(f"{name:<22} {value}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(metrics, f, indent=2)
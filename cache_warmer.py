@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Warm the word-prediction cache before taking traffic
+
+Every keystroke asks for predictions for the sequence typed so far, so the
+sequences worth precomputing are the prefixes of common words. Each button
+sequence is weighted by the lexicon frequency of every word it is a prefix
+of, and the top N are predicted through the normal predict_word path with a
+bounded number of model calls in flight; each answer lands in the shared
+word cache (see phrase_cache.get_word_cache).
+
+The word cache is keyed on the whole prompt context. With the full context
+window in prompts, entries warmed for the start of a text (the default) only
+serve the first word of a session. With WORD_CACHE_CONTEXT_WORDS=1 prompts
+show only the last typed word, and --common-contexts K also warms the top
+sequences after each of the K most common words, which covers much of the
+typing mid-text. --context adds other openings.
+
+Run it as a separate job that saves the cache to a file, and point
+WORD_CACHE_PATH at it; the gunicorn master loads the file before forking, so
+every worker shares one copy (gunicorn.conf.py runs this job itself when
+WARM_CACHE_TOP is set):
+
+    python cache_warmer.py --top 500 --common-contexts 20 --output data/word_cache.json
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from keyboard_predictor import KeyboardPredictor
+from layouts import get_layout
+from lexicon import get_common_words, get_lexicon_frequencies
+from phrase_cache import PhraseCache
+from sequence_index import word_key
+
+
+def top_sequences(layout, top_n):
+    """Return the top_n button sequences of a layout, weighted over all word prefixes"""
+    weights = {}
+    for word, frequency in get_lexicon_frequencies().items():
+        key = word_key(word, layout.letters_to_buttons)
+        if key:
+            for end in range(1, len(key) + 1):
+                weights[key[:end]] = weights.get(key[:end], 0) + frequency
+    ranked = sorted(weights, key=lambda key: (-weights[key], key))
+    return [list(key) for key in ranked[:top_n]]
+
+
+def warm_contexts(predictor, count=0):
+    """
+    Return the contexts worth warming for a predictor: the start of a text
+    and, if its prompts show only the last typed word, the `count` most
+    common words (other contexts would only match whole texts)
+    """
+    contexts = [""]
+    if predictor.word_cache_context_words == 1:
+        contexts += get_common_words()[:count]
+    return contexts
+
+
+async def awarm_cache(predictor, layout, top_n=200, concurrency=8, contexts=("",), progress=None):
+    """
+    Predict the top sequences of `layout` after each of `contexts`, at most
+    `concurrency` at a time, and return a summary dict. `progress` is called
+    with (done, total, elapsed seconds) after each prediction.
+    """
+    jobs = [(sequence, context) for context in contexts for sequence in top_sequences(layout, top_n)]
+    semaphore = asyncio.Semaphore(concurrency)
+    done = errors = 0
+    start = time.perf_counter()
+
+    async def warm(sequence, context):
+        nonlocal done, errors
+        async with semaphore:
+            try:
+                await predictor.apredict_word(sequence, context, layout=layout)
+            except Exception:
+                errors += 1
+            done += 1
+            if progress is not None:
+                progress(done, len(jobs), time.perf_counter() - start)
+
+    await asyncio.gather(*(warm(sequence, context) for sequence, context in jobs))
+    return {
+        "layout": layout.name,
+        "predictions": len(jobs),
+        "errors": errors,
+        "cache_entries": predictor.word_cache.stats()["entries"] if predictor.word_cache is not None else 0,
+        "duration_s": round(time.perf_counter() - start, 3),
+    }
+
+
+def print_progress(done, total, elapsed):
+    """Print a progress line at every 10% of the work"""
+    step = max(total // 10, 1)
+    if done % step == 0 or done == total:
+        print(f"Warmed {done}/{total} predictions ({done * 100 // total}%) in {elapsed:.1f}s")
+
+
+def warm_cache(predictor=None, layout=None, top_n=200, concurrency=8, contexts=("",), progress=print_progress):
+    """Synchronous wrapper around awarm_cache; runs its own event loop"""
+    predictor = predictor or KeyboardPredictor()
+    if predictor.word_cache is None:
+        raise ValueError("The word cache is off; set WORD_CACHE_SIZE to warm it")
+    layout = predictor._resolve_layout(layout)
+    return asyncio.run(awarm_cache(predictor, layout, top_n, concurrency, contexts, progress))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--top", type=int, default=200, help="number of button sequences to warm")
+    parser.add_argument("--concurrency", type=int, default=8, help="model calls in flight at once")
+    parser.add_argument("--layout", action="append", dest="layouts",
+                        help="layout name from layouts.py (repeatable; default: KEYBOARD_LAYOUT)")
+    parser.add_argument("--context", action="append", dest="contexts",
+                        help="preceding text to warm for (repeatable; default: start of text)")
+    parser.add_argument("--common-contexts", type=int, default=0, metavar="K",
+                        help="also warm after each of the K most common words (needs WORD_CACHE_CONTEXT_WORDS=1)")
+    parser.add_argument("--mock", action="store_true", help="use the simulated model instead of the OpenAI API")
+    parser.add_argument("--output", metavar="PATH", help="save the warmed cache here (load it with WORD_CACHE_PATH)")
+    parser.add_argument("--json", metavar="PATH", help="also write the summary as JSON to PATH")
+    args = parser.parse_args()
+
+    predictor = KeyboardPredictor()
+    if args.mock:
+        from llm_clients import LexiconMockClient
+        predictor._client = LexiconMockClient()
+    contexts = list(args.contexts or ("",))
+    if args.common_contexts:
+        if predictor.word_cache_context_words != 1:
+            print("--common-contexts needs WORD_CACHE_CONTEXT_WORDS=1; warming the other contexts only")
+        contexts += [context for context in warm_contexts(predictor, args.common_contexts)
+                     if context not in contexts]
+    layouts = [get_layout(name) for name in args.layouts or (None,)]
+    if predictor.word_cache is None:  # not enabled in this environment; the job still needs one
+        predictor.word_cache = PhraseCache(max_entries=args.top * len(contexts) * len(layouts), window=0)
+
+    summaries = [warm_cache(predictor, layout, args.top, args.concurrency, contexts) for layout in layouts]
+    if args.output:
+        predictor.word_cache.save(args.output)
+
+    for summary in summaries:
+        print("-" * 50)
+        for name, value in summary.items():
+            print(f"{name:<16} {value}")
+    if args.output:
+        print(f"{'output':<16} {args.output}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summaries if len(summaries) > 1 else summaries[0], f, indent=2)
@@ -0,0 +1,102 @@
+"""
+Bounded prompt context for long texts
+
+Prompts only carry the last `max_words` words of what the user has typed, so
+their size (and the model's latency and cost) stays flat however long the
+text gets. Text before that window can be represented by a short summary:
+the words that recur most in it, leaving out common function words. The
+summary is computed locally and cached per session. It is refreshed after
+the earlier text has grown by `refresh_chars` characters, by counting only
+the new text into the session's word counts (pruned to `max_terms`), so a
+refresh costs the same at the end of a long dictation as at the start.
+
+Settings come from CONTEXT_WORDS (window size, default 40) and
+CONTEXT_SUMMARY (1 to add the summary, the default; 0 to drop earlier text).
+"""
+
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from lexicon import get_common_words
+
+WORD_RE = re.compile(r"[A-Za-z']+")
+
+
+class ContextWindow:
+    def __init__(self, max_words=40, summarize=True, summary_words=8, refresh_chars=600,
+                 max_terms=256, max_sessions=1000, stopword_count=200):
+        self.max_words = max_words
+        self.summarize = summarize
+        self.summary_words = summary_words
+        self.refresh_chars = refresh_chars
+        self.max_terms = max_terms
+        self.max_sessions = max_sessions
+        self.stopword_count = stopword_count
+        self._stopwords = None
+        self._summaries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_words=int(os.getenv("CONTEXT_WORDS", "40")),
+            summarize=os.getenv("CONTEXT_SUMMARY", "1") == "1",
+        )
+
+    def _window(self, text):
+        """Return (length of the text before the window, window); only the end of the text is scanned"""
+        span = self.max_words * 32
+        while True:
+            start = max(0, len(text) - span)
+            parts = text[start:].rsplit(None, self.max_words)
+            if len(parts) > self.max_words or start == 0:
+                break
+            span *= 4
+        if len(parts) <= self.max_words:
+            return 0, " ".join(parts)
+        return start + len(parts[0]), " ".join(parts[1:])
+
+    def recent(self, text):
+        """Return the last max_words words of a text"""
+        return self._window(text)[1]
+
+    def build(self, text, session_key=None):
+        """
+        Return (recent, summary) for a prompt: the trailing window of `text`
+        and, if summaries are enabled and a session key is given, a summary
+        of the text before it ("" if there is none).
+        """
+        earlier_length, recent = self._window(text)
+        if not earlier_length or not self.summarize or session_key is None:
+            return recent, ""
+
+        with self._lock:
+            cached = self._summaries.get(session_key)
+            if cached is not None:
+                self._summaries.move_to_end(session_key)
+        if cached is not None and 0 <= earlier_length - cached[0] < self.refresh_chars:
+            return recent, cached[2]
+
+        if cached is not None and earlier_length > cached[0]:
+            counts = Counter(cached[1])
+            self._count(text[cached[0]:earlier_length], counts)
+        else:  # first summary, or the text was cleared or shortened
+            counts = self._count(text[:earlier_length], Counter())
+        counts = Counter(dict(counts.most_common(self.max_terms)))
+        summary = ", ".join(word for word, _ in counts.most_common(self.summary_words))
+        with self._lock:
+            self._summaries[session_key] = (earlier_length, counts, summary)
+            self._summaries.move_to_end(session_key)
+            while len(self._summaries) > self.max_sessions:
+                self._summaries.popitem(last=False)
+        return recent, summary
+
+    def _count(self, text, counts):
+        """Add the content words of `text` to `counts`"""
+        if self._stopwords is None:
+            self._stopwords = frozenset(get_common_words()[:self.stopword_count])
+        counts.update(word for word in (w.upper() for w in WORD_RE.findall(text))
+                      if len(word) > 2 and word not in self._stopwords)
+        return counts
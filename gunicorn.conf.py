@@ -0,0 +1,83 @@
+# Gunicorn settings for multi-worker serving: gunicorn -c gunicorn.conf.py app:app
+# (gunicorn is in the "serve" extra: uv sync --extra serve)
+#
+# The app is loaded once in the master and its lookup tables are built there
+# before the workers fork, so every worker shares the same read-only pages
+# (see sequence_index.py). Set INDEX_DIR to memory-map the tables from files
+# instead, which also shares them between separate deployments on one node.
+
+import gc
+import os
+import subprocess
+import sys
+import tempfile
+
+# Session state must be visible to whichever worker serves a request, so it
+# is kept in files rather than in one worker's memory (see state_store.py)
+os.environ.setdefault("STATE_DIR", os.path.join(tempfile.gettempdir(), "aikeyboard-state"))
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+
+# The views are async, but this is still WSGI: each request holds one of the
+# worker's threads until its response is sent, and each open WebSocket holds
+# one for as long as it stays connected. A worker therefore serves at most
+# `threads` requests and sockets at once, not hundreds; a node serves
+# workers * threads (256 by default). The background event loop in app.py
+# only lets those threads share one OpenAI client and connection pool.
+#
+# Size GUNICORN_THREADS to the in-flight predictions plus open sockets one
+# worker should carry. Keep it under the OpenAI client's connection limit
+# (100 by default), otherwise requests start queueing for a connection too.
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "64"))
+preload_app = True
+
+
+def when_ready(server):
+    """Build lookup tables in the master, then keep the GC from touching them in workers"""
+    import app
+
+    warm_word_cache(app)
+
+    # Don't create the OpenAI clients here: their connection pools must not be
+    # shared across fork, so each worker creates its own in post_worker_init.
+    # This also loads WORD_CACHE_PATH, so the workers share the warmed cache
+    app.warm_up(connect=False)
+    gc.freeze()
+
+
+def warm_word_cache(app):
+    """
+    If WARM_CACHE_TOP is set, run cache_warmer.py once, as a separate process,
+    to write WORD_CACHE_PATH before the master loads it. Warming in the
+    workers instead would repeat every model call in each of them, and keep
+    them from answering gunicorn's heartbeat until it was done.
+    """
+    top_n = int(os.getenv("WARM_CACHE_TOP", "0"))
+    if top_n <= 0:
+        return
+    path = os.getenv("WORD_CACHE_PATH")
+    if not path or int(os.getenv("WORD_CACHE_SIZE", "0")) <= 0:
+        print("WARM_CACHE_TOP needs WORD_CACHE_SIZE and WORD_CACHE_PATH under gunicorn; not warming")
+        return
+
+    command = [
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(app.__file__)), "cache_warmer.py"),
+        "--top", str(top_n),
+        "--concurrency", os.getenv("WARM_CACHE_CONCURRENCY", "8"),
+        "--output", path,
+    ]
+    if os.getenv("WORD_CACHE_CONTEXT_WORDS") == "1":
+        command += ["--common-contexts", os.getenv("WARM_CACHE_CONTEXTS", "20")]
+    for name in app.active_layouts():
+        command += ["--layout", name]
+    if subprocess.run(command).returncode != 0:
+        print("Warming the word cache failed; starting with the cache as it is")
+
+
+def post_worker_init(worker):
+    """Create this worker's OpenAI clients before it accepts requests"""
+    import app
+
+    app.warm_up(connect=bool(os.getenv("OPENAI_API_KEY")))
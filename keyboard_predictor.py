@@ -1,70 +1,270 @@
 import os
 import json
 import re
-from openai import OpenAI
-from names_database import get_names_for_sequence
-
-# Few-shot examples for the LLM
-EXAMPLES = """
-Example 1
-  Previous text: ""
-  Sequence: 2 4 1 2 1
-  -> ["THERE", "THEIR", "THREE"]
-
-Example 2
-  Previous text: "Today"
-  Sequence: 4 3 5
-  -> ["WAS", "HAS", "WAG"]
-
-Example 3
-  Previous text: "My name is"
-  Sequence: 4 1 2 1 3
-  -> ["JACOB"]
-"""
+import asyncio
+import threading
+import time
+import weakref
+from layouts import Layout, get_layout, layout_for_groups
+from user_dictionary import UserDictionary
+from prediction_log import get_prediction_log
+from phrase_cache import get_phrase_cache, get_word_cache
+from reranker import get_reranker, previous_word
+from context_window import ContextWindow
+import profiling
 
 class KeyboardPredictor:
-    def __init__(self):
+    def __init__(self, client=None, async_client=None, layout=None):
         # Use the newest OpenAI model unless changed by the user
         self.model = "gpt-4o"
 
-        # Get API key from environment
+        # The OpenAI clients are created on first use so that importing and
+        # constructing the predictor stays cheap and works offline. Async
+        # clients are bound to an event loop, so one is kept per loop.
+        self._client = client
+        self._async_client = async_client
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._created_client = False
+        self._client_lock = threading.Lock()
+
+        # Words each user has accepted before; a word whose decayed score
+        # reaches user_word_threshold is predicted without calling the LLM
+        self.user_dictionary = UserDictionary.from_env()
+        self.user_word_threshold = 1.5
+
+        # Structured record of every prediction (off unless PREDICTION_LOG is set)
+        self.prediction_log = get_prediction_log()
+        self.phrase_cache = get_phrase_cache()
+        self.word_cache = get_word_cache()
+        self.reranker = get_reranker()
+
+        # With the word cache on, WORD_CACHE_CONTEXT_WORDS=N shows the model
+        # only the last N typed words. Such prompts recur across users and
+        # texts, so cached (and warmed) answers serve words mid-text too, not
+        # just a text's first word; 0 keeps the full context window
+        self.word_cache_context_words = int(os.getenv("WORD_CACHE_CONTEXT_WORDS", "0"))
+
+        # Prompts carry only the last few dozen words of the typed text (plus
+        # a summary of the rest), so their cost does not grow with the text
+        self.context_window = ContextWindow.from_env()
+
+        # Default button layout; predict_word can be given another one per
+        # call, so a single predictor serves sessions on different layouts
+        self.layout = get_layout() if layout is None else self._resolve_layout(layout)
+
+    @property
+    def client(self):
+        """Return the OpenAI client, importing the SDK and creating it on first use."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    self._client = OpenAI(api_key=self._api_key())
+                    self._created_client = True
+        return self._client
+
+    @property
+    def async_client(self):
+        """
+        Return the AsyncOpenAI client for the running event loop, or None if
+        a sync client was supplied without an async one.
+        """
+        if self._async_client is not None:
+            return self._async_client
+        if self._client is not None and not self._created_client:
+            return None
+
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            from openai import AsyncOpenAI
+            client = self._async_clients[loop] = AsyncOpenAI(api_key=self._api_key())
+        return client
+
+    def _api_key(self):
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError(
                 "OpenAI API key not found. Please set the OPENAI_API_KEY environment variable."
             )
-        self.client = OpenAI(api_key=api_key)
-
-        # Frequency-based alphabet groups mapping for 6-button layout
-        self.groups = {
-            1: "EL",
-            2: "TRCQ",
-            3: "ADFV",
-            4: "OHWZ",
-            5: "ISKG",
-            6: "NUMPYBJX",
-        }
+        return api_key
+
+    @property
+    def groups(self):
+        """Button -> letters mapping of the default layout."""
+        return self.layout.groups
+
+    @groups.setter
+    def groups(self, groups):
+        self.layout = layout_for_groups(groups)
+
+    @property
+    def legend(self):
+        """Keyboard legend of the default layout, for the prompt."""
+        return self.layout.legend
+
+    def _resolve_layout(self, layout):
+        """Return a Layout for a layout name, a Layout, or None (the default layout)."""
+        if layout is None:
+            return self.layout
+        if isinstance(layout, Layout):
+            return layout
+        return get_layout(layout)
+
+    def warm_up(self, connect=True):
+        """
+        Do the one-off work normally paid by the first request: build the
+        default layout's lookup tables and, if connect is True, import the
+        OpenAI SDK and create the client (and its connection pool).
+        """
+        self.layout.warm_up()
+        if connect:
+            self.client
+
+    async def awarm_up(self):
+        """Create the AsyncOpenAI client for the running event loop (see async_client)."""
+        self.async_client
 
-    def _context_suggests_name(self, context_text: str) -> bool:
-        """Return True if the context likely indicates a name will follow."""
+    def _name_cue(self, context_text: str) -> float:
+        """
+        Return how strongly the context suggests a name will follow: 1.0
+        after "my name is", 0.4 after "I am" / "I'm" (as often followed by
+        "back" or "going" as by a name), otherwise 0.
+        """
         text = context_text.lower().strip()
         text = re.sub(r"[.!?,]*$", "", text)
-        endings = ["my name is", "name is", "i am", "i'm"]
-        return any(text.endswith(e) for e in endings)
+        if text.endswith("name is"):
+            return 1.0
+        if text.endswith(("i am", "i'm")):
+            return 0.4
+        return 0.0
+
+    def learn_word(self, user_id, word, context_text=""):
+        """
+        Record that a user accepted a word after context_text, for their
+        adaptive dictionary and the shared bigram model used in ranking.
+        """
+        self.user_dictionary.record(user_id, word)
+        self.reranker.bigrams.observe(previous_word(context_text), word)
+
+    def _rank(self, layout, button_sequence, context_text, user_matches=(), model_words=(), trace=None):
+        """Merge model, user, name and lexicon candidates and order them with the reranker."""
+        name_context = self._name_cue(context_text)
+        return self.reranker.rank(
+            model=model_words,
+            lexicon=layout.lexicon_index.lookup_frequencies(button_sequence, limit=8),
+            names=layout.names_index.lookup_frequencies(button_sequence, limit=8) if name_context else (),
+            user=user_matches,
+            context_text=context_text,
+            name_context=name_context,
+            trace=trace,
+        )
+
+    def predict_word_local(self, button_sequence, context_text="", user_id=None, layout=None):
+        """
+        Predict a word from local data only (user dictionary, names, lexicon),
+        without calling the LLM.
+        """
+        if not button_sequence:
+            return {"top_predictions": [], "alternative_words": []}
+
+        layout = self._resolve_layout(layout)
+        context_text = self.context_window.recent(context_text)
+        user_matches = self.user_dictionary.lookup(user_id, button_sequence, layout.groups) if user_id else []
+        words = self._rank(layout, button_sequence, context_text, user_matches)
+        return {
+            "top_predictions": words[:3],
+            "alternative_words": words[3:8],
+            "confidence": 0.5 if words else 0.0,
+            "source": "local",
+        }
 
-    def predict_word(self, button_sequence, context_text=""):
+    def predict_word(self, button_sequence, context_text="", user_id=None, layout=None, session_id=None):
         """
         Predict a word based on button sequence and context using OpenAI API.
+
+        If user_id is given, the user's own vocabulary is consulted first: a
+        strong enough match is returned without a model call, and weaker
+        matches are ranked ahead of the model's candidates. `layout` is a
+        layout name (see layouts.py); the predictor's default if None.
+        session_id keys the summary of earlier text (user_id if None), so a
+        user typing in two sessions gets a summary of each text.
         """
+        return self._run(self._prediction(
+            "predict_word", self._predict_word_steps, button_sequence=button_sequence,
+            context_text=context_text, user_id=user_id, layout=self._resolve_layout(layout),
+            session_id=session_id))
+
+    async def apredict_word(self, button_sequence, context_text="", user_id=None, layout=None, session_id=None):
+        """Async version of predict_word, using the AsyncOpenAI client."""
+        # Don't block the event loop (and every prediction waiting on it)
+        # reading a user's dictionary from disk
+        if user_id and not self.user_dictionary.loaded(user_id):
+            await asyncio.to_thread(self.user_dictionary.load, user_id)
+        return await self._arun(self._prediction(
+            "predict_word", self._predict_word_steps, button_sequence=button_sequence,
+            context_text=context_text, user_id=user_id, layout=self._resolve_layout(layout),
+            session_id=session_id))
+
+    def _predict_word_steps(self, button_sequence, context_text, user_id, layout, session_id=None, trace=None):
+        """predict_word as a generator that yields LLM requests (see _run)."""
         if not button_sequence:
             return {"top_predictions": [], "alternative_words": []}
 
-        prompt = self._build_prompt(button_sequence, context_text)
+        context_text, summary = self.context_window.build(context_text, session_id or user_id)
+
+        user_matches = self.user_dictionary.lookup(user_id, button_sequence, layout.groups) if user_id else []
+        if trace is not None:
+            trace["user_matches"] = user_matches
+        if user_matches and user_matches[0][1] >= self.user_word_threshold:
+            words = self._rank(layout, button_sequence, context_text, user_matches, trace=trace)
+            return {
+                "top_predictions": words[:3],
+                "alternative_words": words[3:8],
+                "confidence": 0.9,
+                "source": "user",
+            }
+
+        # After "my name is", the most common matching names are a better
+        # answer than the model's, and cost nothing. Weaker cues ("I'm") go to
+        # the model, and the reranker merges the matching names in
+        if self._name_cue(context_text) >= 1.0:
+            if layout.names_index.lookup(button_sequence, limit=1):
+                words = self._rank(layout, button_sequence, context_text, user_matches, trace=trace)
+                return {
+                    "top_predictions": words[:3],
+                    "alternative_words": words[3:8],
+                    "confidence": 0.8,
+                    "source": "names",
+                }
+
+        # The model's candidates are shared by everyone whose prompt would be
+        # the same; only the ranking below is per user
+        prompt_context = context_text
+        if self.word_cache is not None and self.word_cache_context_words > 0:
+            prompt_context = self._short_context(context_text)
+            summary = ""
+        cache_key = (self._word_cache_key(layout, button_sequence, prompt_context, summary)
+                     if self.word_cache is not None else None)
+        cached = self.word_cache.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            model_words, confidence = cached
+            if trace is not None:
+                trace["word_cache_hit"] = [list(model_words), confidence]
+            words = self._rank(layout, button_sequence, context_text, user_matches, model_words, trace=trace)
+            return {
+                "top_predictions": words[:3],
+                "alternative_words": words[3:8],
+                "confidence": confidence,
+                "source": "cache",
+            }
+
+        prompt = self._build_prompt(button_sequence, prompt_context, layout, summary)
         temperature = 0.1
 
         # Two-pass LLM call: retry once with slightly higher temperature if invalid
         for attempt in range(2):
-            response = self._call_llm(prompt, temperature)
+            response = yield self._word_request(prompt, temperature)
             data = json.loads(response.choices[0].message.content)
 
             # Combine and uppercase
@@ -73,15 +273,12 @@ class KeyboardPredictor:
             all_raw = raw_top + raw_alt
 
             # Validate each candidate
-            valid = [w for w in all_raw if self._validate_word_sequence(w, button_sequence)]
-
-            if self._context_suggests_name(context_text):
-                name_candidates = [n.upper() for n in get_names_for_sequence(button_sequence, self.groups)]
-                name_candidates = [n for n in name_candidates if self._validate_word_sequence(n, button_sequence)]
-                if name_candidates:
-                    valid = list(dict.fromkeys(name_candidates + valid))
+            valid = [w for w in all_raw if self._validate_word_sequence(w, button_sequence, layout)]
 
             if valid:
+                if cache_key is not None:
+                    self.word_cache.put(cache_key, (tuple(valid), data.get("confidence", 0.0)))
+                valid = self._rank(layout, button_sequence, context_text, user_matches, valid, trace=trace)
                 return {
                     "top_predictions": valid[:3],
                     "alternative_words": valid[3:8],
@@ -96,19 +293,19 @@ class KeyboardPredictor:
             )
             temperature = 0.2
 
+        # If the model never gave a valid word, fall back to the local
+        # candidates (user dictionary, names, lexicon) when there are any
+        words = self._rank(layout, button_sequence, context_text, user_matches, trace=trace)
+        if words:
+            return {
+                "top_predictions": words[:3],
+                "alternative_words": words[3:8],
+                "confidence": 0.5,
+                "source": "local",
+            }
+
         # If still no valid output, return the raw predictions with low confidence
         # This allows user to see what the AI predicted even if validation failed
-        if self._context_suggests_name(context_text):
-            name_candidates = [n.upper() for n in get_names_for_sequence(button_sequence, self.groups)]
-            name_candidates = [n for n in name_candidates if self._validate_word_sequence(n, button_sequence)]
-            if name_candidates:
-                return {
-                    "top_predictions": name_candidates[:3],
-                    "alternative_words": name_candidates[3:8],
-                    "confidence": 0.1,
-                    "validation_failed": True,
-                }
-
         return {
             "top_predictions": raw_top[:3] if raw_top else [],
             "alternative_words": raw_alt[:5] if raw_alt else [],
@@ -116,18 +313,29 @@ class KeyboardPredictor:
             "validation_failed": True
         }
 
-    def _build_prompt(self, button_sequence, context_text):
+    def _short_context(self, context_text):
+        """Return the last word_cache_context_words words of a text, single-spaced"""
+        return " ".join(context_text.split()[-self.word_cache_context_words:])
+
+    def _word_cache_key(self, layout, button_sequence, context_text, summary=""):
+        """Key of the word cache: everything the prompt depends on (layout, sequence, context, summary)."""
+        sequence = ",".join(str(button) for button in button_sequence)
+        return f"{layout.signature}:{sequence}:{summary}:{context_text}"
+
+    def _build_prompt(self, button_sequence, context_text, layout=None, summary=""):
         """
         Construct the few-shot prompt including examples, legend, context, and sequence.
         """
-        legend = "\n".join(f"- Button {k}: {', '.join(v)}" for k, v in self.groups.items())
+        layout = self._resolve_layout(layout)
         seq_str = " ".join(str(x) for x in button_sequence)
         context_line = f"Previous text: \"{context_text}\"\n" if context_text.strip() else ""
+        if summary:
+            context_line = f"Earlier topics: {summary}\n" + context_line
 
         return f"""
-{EXAMPLES}
+{layout.examples}
 Keyboard legend:
-{legend}
+{layout.legend}
 
 {context_line}Sequence: {seq_str}
 
@@ -139,11 +347,115 @@ Respond with JSON:
 }}
 """
 
-    def _call_llm(self, prompt, temperature):
+    def _run(self, steps):
+        """
+        Drive a prediction generator with the sync client.
+
+        The prediction logic is written once as a generator that yields
+        chat-completion keyword arguments and receives the responses (or has
+        the call's exception thrown into it); _run and _arun only differ in
+        how they make the call.
         """
-        Invoke the OpenAI chat completion endpoint with given temperature.
+        try:
+            request = next(steps)
+            while True:
+                try:
+                    response = self.client.chat.completions.create(**request)
+                except Exception as e:
+                    request = steps.throw(e)
+                else:
+                    request = steps.send(response)
+        except StopIteration as stop:
+            return stop.value
+
+    async def _arun(self, steps):
+        """
+        Drive a prediction generator with the async client (see _run). The
+        steps between model calls are profiled for profiled requests, which
+        cProfile cannot see from the request's own thread (see profiling.py).
+        """
+        try:
+            request = profiling.run_step(next, steps)
+            while True:
+                try:
+                    client = self.async_client
+                    if client is None:
+                        response = await asyncio.to_thread(self.client.chat.completions.create, **request)
+                    else:
+                        response = await client.chat.completions.create(**request)
+                except Exception as e:
+                    request = profiling.run_step(steps.throw, e)
+                else:
+                    request = profiling.run_step(steps.send, response)
+        except StopIteration as stop:
+            return stop.value
+
+    def _prediction(self, method, steps_factory, **inputs):
+        """
+        Create the steps generator for a prediction, wrapped so that it is
+        recorded in the prediction log when logging is enabled.
+        """
+        if not self.prediction_log.enabled:
+            return steps_factory(**inputs)
+
+        trace = {
+            "ts": time.time(),
+            "method": method,
+            "inputs": {key: value for key, value in inputs.items() if key not in ("user_id", "layout", "session_id")},
+            "layout": inputs.get("layout", self.layout).groups,
+            "model": self.model,
+            "llm_calls": [],
+        }
+        return self._traced(trace, steps_factory(trace=trace, **inputs))
+
+    def _traced(self, trace, steps):
+        """Pass a steps generator through, recording its LLM exchanges, result and timings."""
+        start = time.perf_counter()
+        llm_seconds = 0.0
+        try:
+            request = next(steps)
+            while True:
+                call = {"temperature": request.get("temperature")}
+                trace["llm_calls"].append(call)
+                call_start = time.perf_counter()
+                try:
+                    response = yield request
+                except Exception as e:
+                    call["error"] = str(e)
+                    call["ms"] = round((time.perf_counter() - call_start) * 1000, 3)
+                    llm_seconds += time.perf_counter() - call_start
+                    request = steps.throw(e)
+                else:
+                    call["ms"] = round((time.perf_counter() - call_start) * 1000, 3)
+                    llm_seconds += time.perf_counter() - call_start
+                    call["content"] = response.choices[0].message.content
+                    usage = getattr(response, "usage", None)
+                    call["tokens"] = getattr(usage, "total_tokens", None)
+                    request = steps.send(response)
+        except StopIteration as stop:
+            result = stop.value
+            trace["result"] = result
+            if isinstance(result, dict):
+                trace["validation_failed"] = bool(result.get("validation_failed"))
+            return result
+        except Exception as e:
+            trace["error"] = str(e)
+            raise
+        finally:
+            total_seconds = time.perf_counter() - start
+            trace["retries"] = max(len(trace["llm_calls"]) - 1, 0)
+            trace["timings_ms"] = {
+                "total": round(total_seconds * 1000, 3),
+                "llm": round(llm_seconds * 1000, 3),
+                "local": round((total_seconds - llm_seconds) * 1000, 3),
+            }
+            self.prediction_log.log(trace)
+
+    def _word_request(self, prompt, temperature):
+        """
+        Chat completion arguments for a word prediction at the given temperature.
         """
-        return self.client.chat.completions.create(
+        return dict(
             model=self.model,
             messages=[
                 {
@@ -161,31 +473,57 @@ Respond with JSON:
             response_format={"type": "json_object"},
         )
 
-    def _validate_word_sequence(self, word, button_sequence):
+    def _validate_word_sequence(self, word, button_sequence, layout=None):
         """
         Ensure each letter of the word matches the corresponding button group.
         """
+        groups = self._resolve_layout(layout).groups
         if len(word) != len(button_sequence):
             print(f"Length mismatch: word '{word}' has {len(word)} letters, sequence has {len(button_sequence)} buttons")
             return False
         for i, (ch, btn) in enumerate(zip(word, button_sequence)):
-            if ch not in self.groups.get(btn, ""):
-                expected_letters = self.groups.get(btn, "")
+            if ch not in groups.get(btn, ""):
+                expected_letters = groups.get(btn, "")
                 print(f"Validation failed for word '{word}' at position {i}: letter '{ch}' not in button {btn} group '{expected_letters}'")
                 return False
         return True
 
-    def predict_next_words(self, current_text, current_word=""):
+    def predict_next_words(self, current_text, current_word="", user_id=None):
         """
         Predict the next words based on context using OpenAI.
+
+        With user_id (a session id in the app), a summary of text before the
+        context window is kept for it and added to the prompt.
         """
-        context = ((current_text + " " + current_word).strip()
-                   if current_word else current_text.strip())
+        return self._run(self._prediction(
+            "predict_next_words", self._predict_next_words_steps,
+            current_text=current_text, current_word=current_word, user_id=user_id))
+
+    async def apredict_next_words(self, current_text, current_word="", user_id=None):
+        """Async version of predict_next_words, using the AsyncOpenAI client."""
+        return await self._arun(self._prediction(
+            "predict_next_words", self._predict_next_words_steps,
+            current_text=current_text, current_word=current_word, user_id=user_id))
+
+    def _predict_next_words_steps(self, current_text, current_word, user_id=None, trace=None):
+        """predict_next_words as a generator that yields LLM requests (see _run)."""
+        recent, summary = self.context_window.build(current_text, user_id)
+        context = ((recent + " " + current_word).strip()
+                   if current_word else recent.strip())
         if not context:
             return []
 
+        cache_key = self.phrase_cache.key(context) if self.phrase_cache is not None else None
+        if cache_key:
+            cached = self.phrase_cache.get(cache_key)
+            if cached is not None:
+                if trace is not None:
+                    trace["phrase_cache_hit"] = True
+                return list(cached)
+
+        summary_line = f"Earlier topics: {summary}\n" if summary else ""
         prompt = f"""
-Given this text: \"{context}\"
+{summary_line}Given this text: \"{context}\"
 
 Predict the 3 most likely next words that would follow naturally.
 Respond with JSON:
@@ -193,7 +531,7 @@ Respond with JSON:
 """
 
         try:
-            resp = self.client.chat.completions.create(
+            resp = yield dict(
                 model=self.model,
                 messages=[
                     {"role": "system", "content": (
@@ -206,6 +544,9 @@ Respond with JSON:
                 response_format={"type": "json_object"},
             )
             result = json.loads(resp.choices[0].message.content)
-            return result.get("next_words", [])
+            next_words = result.get("next_words", [])
+            if cache_key and next_words:
+                self.phrase_cache.put(cache_key, tuple(next_words))
+            return next_words
         except Exception:
             return []  # silent fallback
@@ -0,0 +1,189 @@
+"""
+Keyboard layouts
+
+A layout is data: which letters each button carries, plus the computer keys
+that press the buttons. Layouts are listed in LAYOUTS and can be extended or
+overridden with a JSON file named by LAYOUTS_PATH, in the same shape:
+    {"five": {"groups": {"1": "ETAOI", ...}, "keys": "DFGJK"}}
+
+Every session types on one layout. New sessions get KEYBOARD_LAYOUT, or, if
+LAYOUT_EXPERIMENT is set (e.g. "six:50,four:50"), a layout picked by weight
+from a hash of the session id, so a session always lands on the same arm.
+
+Each Layout is built once per process and shared by all sessions on it. Its
+lookup tables (letter -> button map, prompt legend and examples, lexicon and
+name indexes) are built the first time they are needed and kept.
+"""
+
+import json
+import os
+import threading
+import zlib
+
+from lexicon import get_client_index, get_lexicon_index
+from names_database import get_names_index
+from sequence_index import layout_signature, letter_map, word_key
+
+LAYOUTS = {
+    # Frequency-balanced six-button layout
+    "six": {
+        "groups": {1: "EL", 2: "TRCQ", 3: "ADFV", 4: "OHWZ", 5: "ISKG", 6: "NUMPYBJX"},
+        "keys": "SDFJKL",
+    },
+    # Four buttons, letters grouped by English frequency tier
+    "four": {
+        "groups": {1: "ETAOINH", 2: "SRDLCUG", 3: "MPFYWB", 4: "VKXQJZ"},
+        "keys": "DFJK",
+    },
+}
+
+DEFAULT_LAYOUT = os.getenv("KEYBOARD_LAYOUT", "six")
+
+# Few-shot examples for the prediction prompt: previous text and the words to
+# answer. Each layout shows them with its own sequences (see prompt_examples).
+PROMPT_EXAMPLES = [
+    ("", ["THERE", "THEIR", "THREE"]),
+    ("Today", ["WAS", "HAS", "WAG"]),
+    ("My name is", ["JACOB"]),
+]
+
+
+def prompt_examples(letters_to_buttons):
+    """
+    Return the prompt's few-shot examples for a layout. Each example's
+    sequence is that of its first word the layout can type, and only words
+    with that same sequence are shown as answers; examples with no typable
+    word are dropped.
+    """
+    blocks = []
+    for context, words in PROMPT_EXAMPLES:
+        keys = [(word, word_key(word, letters_to_buttons)) for word in words]
+        keys = [(word, key) for word, key in keys if key]
+        if not keys:
+            continue
+        sequence = keys[0][1]
+        answers = [word for word, key in keys if key == sequence]
+        blocks.append(
+            f"Example {len(blocks) + 1}\n"
+            f"  Previous text: {json.dumps(context)}\n"
+            f"  Sequence: {' '.join(map(str, sequence))}\n"
+            f"  -> {json.dumps(answers)}"
+        )
+    return "\n" + "\n\n".join(blocks) + "\n"
+
+
+class Layout:
+    def __init__(self, name, groups, keys=""):
+        self.name = name
+        self.groups = {int(button): letters.upper() for button, letters in sorted(groups.items(), key=lambda g: int(g[0]))}
+        self.keys = keys.upper()
+        self.letters_to_buttons = letter_map(self.groups)
+        if len(self.letters_to_buttons) != sum(len(letters) for letters in self.groups.values()):
+            raise ValueError(f"Layout {name!r} puts a letter on more than one button")
+        self.signature = layout_signature(self.groups)
+        self.legend = "\n".join(f"- Button {k}: {', '.join(v)}" for k, v in self.groups.items())
+        self.examples = prompt_examples(self.letters_to_buttons)
+
+    @property
+    def buttons(self):
+        return list(self.groups)
+
+    def is_button(self, button):
+        """Return True if `button` is a button number of this layout"""
+        return isinstance(button, int) and not isinstance(button, bool) and button in self.groups
+
+    @property
+    def key_map(self):
+        """Computer keys (lowercase) and digits mapped to the buttons they press"""
+        mapping = {str(button): button for button in self.groups if button < 10}
+        mapping.update({key.lower(): button for key, button in zip(self.keys, self.groups)})
+        return mapping
+
+    @property
+    def lexicon_index(self):
+        return get_lexicon_index(self.groups)
+
+    @property
+    def names_index(self):
+        return get_names_index(self.groups)
+
+    def client_index(self, top_n=5):
+        """(body, etag) of the browser-side prediction index for this layout"""
+        return get_client_index(self.groups, top_n)
+
+    def warm_up(self):
+        """Build this layout's lookup tables now instead of on first use"""
+        self.lexicon_index
+        self.names_index
+
+
+_layouts = None
+_custom_layouts = {}
+_layouts_lock = threading.Lock()
+
+
+def _load_layouts():
+    specs = dict(LAYOUTS)
+    path = os.getenv("LAYOUTS_PATH")
+    if path:
+        with open(path, encoding="utf-8") as f:
+            specs.update(json.load(f))
+    return {name: Layout(name, spec["groups"], spec.get("keys", "")) for name, spec in specs.items()}
+
+
+def get_layouts():
+    """Return {name: Layout} for every configured layout"""
+    global _layouts
+    if _layouts is None:
+        with _layouts_lock:
+            if _layouts is None:
+                _layouts = _load_layouts()
+    return _layouts
+
+
+def get_layout(name=None):
+    """Return the layout called `name` (the default layout if None); raises KeyError if unknown"""
+    return get_layouts()[name or DEFAULT_LAYOUT]
+
+
+def layout_for_groups(groups):
+    """Return a Layout for an arbitrary button -> letters mapping, reusing a configured one if it matches"""
+    signature = layout_signature({int(button): letters for button, letters in groups.items()})
+    for layout in get_layouts().values():
+        if layout.signature == signature:
+            return layout
+    with _layouts_lock:
+        layout = _custom_layouts.get(signature)
+        if layout is None:
+            layout = _custom_layouts[signature] = Layout(f"custom-{signature}", groups)
+    return layout
+
+
+def active_layouts():
+    """Return the names of the layouts new sessions can be assigned"""
+    experiment = os.getenv("LAYOUT_EXPERIMENT")
+    names = [arm.strip().partition(":")[0] for arm in experiment.split(",")] if experiment else []
+    return [name for name in names if name in get_layouts()] or [DEFAULT_LAYOUT]
+
+
+def assign_layout(session_id):
+    """Pick the layout name for a new session (see LAYOUT_EXPERIMENT)"""
+    experiment = os.getenv("LAYOUT_EXPERIMENT")
+    if not experiment:
+        return DEFAULT_LAYOUT
+
+    arms = []
+    for arm in experiment.split(","):
+        name, _, weight = arm.strip().partition(":")
+        if name in get_layouts():
+            arms.append((name, int(weight or 1)))
+    total = sum(weight for _, weight in arms)
+    if not total:
+        return DEFAULT_LAYOUT
+
+    point = zlib.crc32(session_id.encode("utf-8")) % total
+    for name, weight in arms:
+        if point < weight:
+            return name
+        point -= weight
+    return DEFAULT_LAYOUT
@@ -0,0 +1,73 @@
+"""
+Common English word lexicon for local (model-free) word lookups
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+from sequence_index import layout_signature, shared_index
+
+LEXICON_PATH = os.getenv(
+    "LEXICON_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "common_words.txt"),
+)
+
+_words = None
+_client_indexes = {}
+_client_indexes_lock = threading.Lock()
+
+
+def get_common_words():
+    """Return the lexicon as a tuple of uppercase words, most frequent first"""
+    global _words
+    if _words is None:
+        with open(LEXICON_PATH, encoding="utf-8") as f:
+            _words = tuple(dict.fromkeys(line.strip().upper() for line in f if line.strip()))
+    return _words
+
+
+def get_lexicon_frequencies():
+    """Return {WORD: frequency}, approximated from each word's rank (Zipf's law)"""
+    return {word: 1000000 // rank for rank, word in enumerate(get_common_words(), start=1)}
+
+
+def get_lexicon_index(groups):
+    """Return the shared button-sequence index of the lexicon for a layout"""
+    return shared_index("lexicon", groups, get_lexicon_frequencies, (LEXICON_PATH,))
+
+
+def get_client_index(groups, top_n=5):
+    """
+    Return (body, etag) for the browser-side prediction index of a layout.
+
+    The body is compact JSON holding the layout and the top_n most frequent
+    words for every button key. It is serialized once per layout and size,
+    and the etag is derived from its content, so it changes whenever the
+    layout or lexicon does.
+    """
+    cache_key = (layout_signature(groups), top_n)
+    cached = _client_indexes.get(cache_key)
+    if cached is not None:
+        return cached
+
+    with _client_indexes_lock:
+        cached = _client_indexes.get(cache_key)
+        if cached is None:
+            words_by_key = {}
+            for key, word in get_lexicon_index(groups).items():
+                candidates = words_by_key.setdefault("".join(map(str, key)), [])
+                if len(candidates) < top_n:
+                    candidates.append(word)
+
+            payload = {
+                "groups": {str(button): letters for button, letters in groups.items()},
+                "top_n": top_n,
+                "words": words_by_key,
+            }
+            digest = hashlib.sha1(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+            payload["version"] = digest
+            body = json.dumps(payload, separators=(",", ":"))
+            cached = _client_indexes[cache_key] = (body, digest)
+    return cached
@@ -0,0 +1,79 @@
+"""
+Stand-ins and wrappers for the OpenAI client, for benchmarks and offline tools
+
+They implement just the part of the client KeyboardPredictor uses:
+client.chat.completions.create(**kwargs) returning an object with
+choices[0].message.content (and usage.total_tokens where known).
+"""
+
+import json
+import re
+from types import SimpleNamespace
+
+from lexicon import get_lexicon_index
+
+
+def make_response(content, total_tokens=None):
+    """Build a minimal chat-completion response object"""
+    usage = SimpleNamespace(total_tokens=total_tokens) if total_tokens is not None else None
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+        usage=usage,
+    )
+
+
+class CannedClient:
+    """Returns the same response content for every call"""
+
+    def __init__(self, content):
+        response = make_response(content)
+        create = lambda **kwargs: response
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=create))
+
+
+class LexiconMockClient:
+    """
+    Simulated model that answers from the lexicon: word predictions are the
+    most frequent lexicon words for the prompt's sequence, next-word
+    predictions are the most frequent words overall. The layout is read from
+    the prompt's keyboard legend, falling back to `groups`. Token usage is
+    estimated from text length.
+    """
+
+    def __init__(self, groups=None):
+        self.groups = groups
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        prompt = kwargs["messages"][-1]["content"]
+        match = re.search(r"^Sequence: ([\d ]+)$", prompt, re.MULTILINE)
+        if match:
+            sequence = [int(b) for b in match.group(1).split()]
+            legend = re.findall(r"^- Button (\d+): ([A-Z, ]+)$", prompt, re.MULTILINE)
+            groups = {int(button): letters.replace(", ", "") for button, letters in legend} or self.groups
+            words = get_lexicon_index(groups).lookup(sequence, limit=8)
+            content = json.dumps({
+                "top_predictions": words[:3],
+                "alternative_words": words[3:8],
+                "confidence": 0.5 if words else 0.0,
+            })
+        else:
+            content = json.dumps({"next_words": ["the", "and", "to"]})
+        return make_response(content, total_tokens=(len(prompt) + len(content)) // 4)
+
+
+class CountingClient:
+    """Wraps a client and counts calls and reported token usage"""
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = 0
+        self.total_tokens = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        response = self.client.chat.completions.create(**kwargs)
+        self.calls += 1
+        usage = getattr(response, "usage", None)
+        self.total_tokens += getattr(usage, "total_tokens", 0) or 0
+        return response
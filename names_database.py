@@ -1,8 +1,25 @@
 """
 Name database for AI keyboard predictions
 Contains common first names and surnames for better prediction accuracy
+
+The built-in lists below are a small fallback. For census-scale coverage,
+point FIRST_NAMES_PATH and SURNAMES_PATH at name lists with frequencies, one
+"NAME,COUNT" line per name (optionally gzipped; SSA "Name,Sex,Count" files
+work as-is, and header or malformed lines are skipped). A name appearing more
+than once, or in both lists, is counted once with its counts added up.
+
+Names are only held as compact per-layout indexes (see sequence_index), with
+names sharing a button sequence ordered by frequency, most common first.
+Set INDEX_DIR to build those indexes once and memory-map them afterwards;
+the index files are named after the name files, so pointing the paths at
+other files (or updating them) builds new ones.
 """
 
+import gzip
+import os
+
+from sequence_index import shared_index
+
 # Top US Census first names (both male and female)
 FIRST_NAMES = [
     # Male names
@@ -42,37 +59,69 @@ SURNAMES = [
     "BROOKS", "CHAVEZ", "WOOD", "JAMES", "BENNETT", "GRAY", "MENDOZA", "RUIZ", "HUGHES"
 ]
 
-def get_all_names():
-    """Return all names (first names + surnames) as a set"""
-    return set(FIRST_NAMES + SURNAMES)
+FIRST_NAMES_PATH = os.getenv("FIRST_NAMES_PATH")
+SURNAMES_PATH = os.getenv("SURNAMES_PATH")
+
+# Layout with one letter per button: its index maps each name to itself,
+# which gives a compact membership test for is_name()
+SPELLING_LAYOUT = {i: chr(ord("A") + i - 1) for i in range(1, 27)}
+
+
+def _read_frequencies(path, frequencies):
+    """Add the NAME,COUNT lines of a (possibly gzipped) file into `frequencies`"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            fields = line.strip().split(",")
+            if len(fields) < 2 or not fields[-1].strip().isdigit():
+                continue
+            name = fields[0].strip().upper()
+            if name.isalpha():
+                frequencies[name] = frequencies.get(name, 0) + int(fields[-1])
+
+
+def _builtin_frequencies(names, frequencies):
+    """Approximate counts for a built-in list from its rank (Zipf's law)"""
+    for rank, name in enumerate(dict.fromkeys(names), start=1):
+        frequencies[name] = frequencies.get(name, 0) + 1000000 // rank
+
 
-def get_names_for_sequence(button_sequence, groups):
+def get_name_frequencies():
+    """
+    Return {NAME: frequency} for all first names and surnames. Built from the
+    configured files (or the built-in lists) on every call, so callers should
+    keep only what they derive from it.
+    """
+    frequencies = {}
+    for path, fallback in ((FIRST_NAMES_PATH, FIRST_NAMES), (SURNAMES_PATH, SURNAMES)):
+        if path:
+            _read_frequencies(path, frequencies)
+        else:
+            _builtin_frequencies(fallback, frequencies)
+    return frequencies
+
+
+def get_names_index(groups):
+    """Return the shared button-sequence index of all names for a layout"""
+    return shared_index("names", groups, get_name_frequencies, (FIRST_NAMES_PATH, SURNAMES_PATH))
+
+
+def get_names_for_sequence(button_sequence, groups, limit=None):
     """
     Get names that match a specific button sequence
     
     Args:
         button_sequence: List of button presses
         groups: Dictionary mapping buttons to letter groups
+        limit: Maximum number of names to return (all if None)
     
     Returns:
-        List of matching names
+        List of matching names, most frequent first
     """
-    all_names = get_all_names()
-    matching_names = []
-    
-    for name in all_names:
-        if len(name) == len(button_sequence):
-            match = True
-            for i, letter in enumerate(name):
-                button = button_sequence[i]
-                if letter not in groups.get(button, ""):
-                    match = False
-                    break
-            if match:
-                matching_names.append(name)
-    
-    return matching_names
+    return get_names_index(groups).lookup(button_sequence, limit)
+
 
 def is_name(word):
     """Check if a word is in our name database"""
-    return word.upper() in get_all_names()
\ No newline at end of file
+    key = [ord(ch) - ord("A") + 1 for ch in word.upper()]
+    return word.upper() in get_names_index(SPELLING_LAYOUT).lookup(key)
@@ -0,0 +1,171 @@
+"""
+Shared caches of predictions keyed on the last few typed words
+
+Next-word suggestions depend mostly on the end of the text, and short phrases
+("my name is", "thank you for") recur across users, so one process-wide cache
+serves them all. Keys are the trailing `window` words, lowercased and
+stripped of punctuation. A second, opt-in cache holds the model's word
+candidates per layout, button sequence and prompt context (see
+get_word_cache); it can be filled ahead of traffic by cache_warmer.py.
+
+Both caches are bounded and evict by popularity (segmented LRU): new keys
+enter a probation segment and are promoted to a protected segment on their
+first hit. Eviction takes the least recently used probation entry first, so
+a burst of one-off keys cannot push out keys that keep being reused.
+"""
+
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+class PhraseCache:
+    def __init__(self, max_entries=10000, window=3, protected_fraction=0.8):
+        self.max_entries = max_entries
+        self.window = window
+        self.max_protected = int(max_entries * protected_fraction)
+        self._probation = OrderedDict()
+        self._protected = OrderedDict()
+        self._hit_counts = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, text):
+        """Return the cache key for a text: its last `window` words, normalized"""
+        words = WORD_RE.findall(text.lower())
+        return " ".join(words[-self.window:]) if self.window > 0 else ""
+
+    def get(self, key):
+        """Return the cached value for a key, or None"""
+        with self._lock:
+            if key in self._protected:
+                self._protected.move_to_end(key)
+                value = self._protected[key]
+            elif key in self._probation:
+                value = self._probation.pop(key)
+                self._protected[key] = value
+                if len(self._protected) > self.max_protected:
+                    demoted, demoted_value = self._protected.popitem(last=False)
+                    self._probation[demoted] = demoted_value
+            else:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._hit_counts[key] = self._hit_counts.get(key, 0) + 1
+            return value
+
+    def put(self, key, value):
+        """Store an (immutable) value for a key, evicting the least popular entry if full"""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if key in self._protected:
+                self._protected[key] = value
+                return
+            self._probation[key] = value
+            self._probation.move_to_end(key)
+            while len(self._probation) + len(self._protected) > self.max_entries:
+                segment = self._probation or self._protected
+                evicted, _ = segment.popitem(last=False)
+                self._hit_counts.pop(evicted, None)
+                self.evictions += 1
+
+    def snapshot(self):
+        """Return the entries as [key, value] pairs, least popular first, for save()"""
+        with self._lock:
+            return [[key, value] for segment in (self._probation, self._protected)
+                    for key, value in segment.items()]
+
+    def save(self, path):
+        """Write the entries to a JSON file, atomically"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        """Add the entries of a file written by save(); returns how many were read"""
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f)
+        for key, value in entries:
+            self.put(key, _freeze(value))
+        return len(entries)
+
+    def clear(self):
+        with self._lock:
+            self._probation.clear()
+            self._protected.clear()
+            self._hit_counts.clear()
+
+    def stats(self, top=10):
+        """Return counters, sizes and the most reused phrases"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            popular = sorted(self._hit_counts.items(), key=lambda item: -item[1])[:top]
+            return {
+                "entries": len(self._probation) + len(self._protected),
+                "protected": len(self._protected),
+                "max_entries": self.max_entries,
+                "window": self.window,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "top_phrases": popular,
+            }
+
+
+def _freeze(value):
+    """Turn JSON lists back into tuples so loaded values are immutable"""
+    return tuple(_freeze(item) for item in value) if isinstance(value, list) else value
+
+
+_phrase_cache = None
+_word_cache = None
+_phrase_cache_lock = threading.Lock()
+
+
+def get_phrase_cache():
+    """
+    Return the process-wide phrase cache, sized by PHRASE_CACHE_SIZE (entries,
+    0 disables it) and PHRASE_CACHE_WORDS (trailing words in the key)
+    """
+    global _phrase_cache
+    if _phrase_cache is None:
+        with _phrase_cache_lock:
+            if _phrase_cache is None:
+                _phrase_cache = PhraseCache(
+                    max_entries=int(os.getenv("PHRASE_CACHE_SIZE", "10000")),
+                    window=int(os.getenv("PHRASE_CACHE_WORDS", "3")),
+                )
+    return _phrase_cache
+
+
+def get_word_cache():
+    """
+    Return the process-wide word-prediction cache, or None unless
+    WORD_CACHE_SIZE (entries) is set. Keys hold the whole prompt context
+    (see KeyboardPredictor._word_cache_key), so a hit always answers the
+    prompt the model would have been sent. If WORD_CACHE_PATH names a file
+    written by cache_warmer.py, its entries are loaded when the cache is
+    created.
+    """
+    global _word_cache
+    size = int(os.getenv("WORD_CACHE_SIZE", "0"))
+    if size <= 0:
+        return None
+    if _word_cache is None:
+        with _phrase_cache_lock:
+            if _word_cache is None:
+                cache = PhraseCache(max_entries=size, window=0)
+                path = os.getenv("WORD_CACHE_PATH")
+                if path and os.path.exists(path):
+                    cache.load(path)
+                _word_cache = cache
+    return _word_cache
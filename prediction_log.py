@@ -0,0 +1,134 @@
+"""
+Structured prediction log
+
+Each predict_word / predict_next_words call can be recorded as one JSON line:
+its inputs, layout and model, every LLM exchange (request temperature,
+response content, tokens, latency), the candidates returned, validation
+outcome, retry count and timings. replay.py re-runs such a log against the
+current code with the recorded LLM responses played back.
+
+Logging is off unless PREDICTION_LOG names a file. Records are handed to a
+background thread through a bounded queue and written in batches, so the
+request path never waits on disk; if the queue is full, records are dropped
+and counted rather than blocking. If the file cannot be opened or written,
+the log disables itself and the request path carries on unlogged.
+"""
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+
+
+class PredictionLog:
+    def __init__(self, path=None, max_pending=10000, batch_size=100):
+        self.path = path
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._writer = None
+        self._writer_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def log(self, record):
+        """Queue a record for writing; never blocks or raises"""
+        if not self.enabled:
+            return
+        if self._writer is None:
+            self._start_writer()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=5.0):
+        """Wait up to `timeout` seconds for queued records to be written"""
+        if self._writer is None:
+            return True
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._writer.is_alive():
+                    return False
+                self._queue.all_tasks_done.wait(min(remaining, 0.1))
+        return True
+
+    def _start_writer(self):
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="prediction-log", daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+
+    def _disable(self, error):
+        print(f"Prediction log disabled, cannot write {self.path}: {error}")
+        self.path = None
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+            self.dropped += 1
+            self._queue.task_done()
+
+    def _write_loop(self):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            f = open(self.path, "a", encoding="utf-8")
+        except OSError as e:
+            self._disable(e)
+            return
+
+        with f:
+            while True:
+                batch = [self._queue.get()]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                error = None
+                try:
+                    f.write("".join(json.dumps(record, separators=(",", ":"), default=str) + "\n"
+                                    for record in batch))
+                    f.flush()
+                except OSError as e:
+                    error = e
+                    self.dropped += len(batch)
+                except (TypeError, ValueError):  # a record that cannot be serialized
+                    self.dropped += len(batch)
+                for _ in batch:
+                    self._queue.task_done()
+                if error is not None:
+                    self._disable(error)
+                    return
+
+
+_prediction_log = None
+_prediction_log_lock = threading.Lock()
+
+
+def get_prediction_log():
+    """Return the process-wide prediction log configured by PREDICTION_LOG"""
+    global _prediction_log
+    if _prediction_log is None:
+        with _prediction_log_lock:
+            if _prediction_log is None:
+                _prediction_log = PredictionLog(os.getenv("PREDICTION_LOG") or None)
+    return _prediction_log
+
+
+def read_log(path):
+    """Yield the records of a prediction log file"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,185 @@
+"""
+Opt-in request profiling for the Flask app
+
+Disabled unless PROFILING=1 is set, in which case install() wraps every view
+function; when disabled, install() does nothing and requests pay no cost.
+
+When enabled, a request is profiled with cProfile if it carries an
+`X-Profile: <PROFILE_TOKEN>` header (ignored unless PROFILE_TOKEN is set, so
+anonymous clients cannot force profiling) or is picked by PROFILE_SAMPLE_RATE
+(0.0-1.0). The
+profile covers the route in the request's thread and the KeyboardPredictor
+work it runs on the model-call loop's thread: coroutines that app.on_llm_loop
+submits carry the request's loop profiler (see carry), and the predictor
+enables it around each prediction step it runs (see run_step). Time spent
+waiting on model calls shows up as waiting. Results are reported two ways:
+    - a Server-Timing header with the total and the slowest functions by
+      cumulative time, visible in browser dev tools
+    - a .prof file in PROFILE_DIR (if set), loadable with pstats or snakeviz;
+      its name is returned in the X-Profile-File header. Only the newest
+      PROFILE_MAX_FILES (default 100) files are kept.
+"""
+
+import contextvars
+import cProfile
+import functools
+import hmac
+import inspect
+import os
+import pstats
+import random
+import re
+import time
+
+from flask import make_response, request
+
+ENABLED = os.getenv("PROFILING", "") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR") or None
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN") or None
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "100"))
+SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+SUMMARY_FUNCTIONS = 5
+
+# Profiler for the work a profiled request runs on another thread's event loop
+_loop_profiler = contextvars.ContextVar("loop_profiler", default=None)
+
+
+def _should_profile():
+    token = request.headers.get("X-Profile")
+    if token and PROFILE_TOKEN and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode()):
+        return True
+    return SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE
+
+
+def _start():
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # another profiler is active in this interpreter
+        return None
+    return profiler
+
+
+def carry(coro):
+    """
+    Return `coro` ready to be run on another thread's event loop: if the
+    current request is profiled, the steps it runs there are profiled too
+    """
+    profiler = _loop_profiler.get()
+    if profiler is None:
+        return coro
+
+    async def carried():
+        _loop_profiler.set(profiler)  # the task runs in a copy of the loop's context
+        return await coro
+    return carried()
+
+
+def run_step(step, *args):
+    """Call step(*args), profiling it if it runs for a profiled request (see carry)"""
+    profiler = _loop_profiler.get()
+    if profiler is None:
+        return step(*args)
+    try:
+        profiler.enable()
+    except ValueError:  # another profiler is active on this thread
+        return step(*args)
+    try:
+        return step(*args)
+    finally:
+        profiler.disable()
+
+
+def _finish(profiler, loop_profiler, endpoint, started, rv):
+    """Attach the profile summary to the response and save the profile if configured"""
+    total_ms = (time.perf_counter() - started) * 1000
+    response = make_response(rv)
+
+    stats = pstats.Stats(profiler)
+    if loop_profiler.getstats():
+        stats.add(loop_profiler)
+    entries = []
+    for (filename, line, name), (_, _, _, cumulative, _) in stats.stats.items():
+        if filename == "~" or name.startswith("<"):
+            continue  # builtins and comprehensions
+        if f"{os.sep}asyncio{os.sep}" in filename or filename.endswith("selectors.py"):
+            continue  # event loop plumbing wraps everything in async views
+        module = os.path.splitext(os.path.basename(filename))[0]
+        entries.append((cumulative * 1000, f"{module}.{name}"))
+    entries.sort(reverse=True)
+
+    timings = [f"total;dur={total_ms:.2f}"]
+    for duration, label in entries[:SUMMARY_FUNCTIONS]:
+        token = re.sub(r"[^A-Za-z0-9_.-]", "_", label)
+        timings.append(f"{token};dur={duration:.2f}")
+    response.headers["Server-Timing"] = ", ".join(timings)
+
+    if PROFILE_DIR:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{os.getpid()}-{int(started * 1e6) % 1000000}.prof"
+        stats.dump_stats(os.path.join(PROFILE_DIR, filename))
+        response.headers["X-Profile-File"] = filename
+        _prune(PROFILE_DIR, PROFILE_MAX_FILES)
+    return response
+
+
+def _prune(directory, max_files):
+    """Delete the oldest .prof files in a directory beyond the newest max_files"""
+    paths = []
+    for name in os.listdir(directory):
+        if name.endswith(".prof"):
+            path = os.path.join(directory, name)
+            try:
+                paths.append((os.stat(path).st_mtime, path))
+            except OSError:  # removed by another worker meanwhile
+                pass
+    paths.sort(reverse=True)
+    for _, path in paths[max_files:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def profiled(view, endpoint):
+    """Wrap a (sync or async) view function so that selected requests are profiled"""
+    if inspect.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            profiler = _start() if _should_profile() else None
+            if profiler is None:
+                return await view(*args, **kwargs)
+            loop_profiler = cProfile.Profile()
+            token = _loop_profiler.set(loop_profiler)
+            started = time.perf_counter()
+            try:
+                rv = await view(*args, **kwargs)
+            finally:
+                profiler.disable()
+                _loop_profiler.reset(token)
+            return _finish(profiler, loop_profiler, endpoint, started, rv)
+    else:
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            profiler = _start() if _should_profile() else None
+            if profiler is None:
+                return view(*args, **kwargs)
+            loop_profiler = cProfile.Profile()
+            token = _loop_profiler.set(loop_profiler)
+            started = time.perf_counter()
+            try:
+                rv = view(*args, **kwargs)
+            finally:
+                profiler.disable()
+                _loop_profiler.reset(token)
+            return _finish(profiler, loop_profiler, endpoint, started, rv)
+    return wrapper
+
+
+def install(app, exclude=("static",)):
+    """Wrap the app's views for profiling; does nothing unless PROFILING=1"""
+    if not ENABLED:
+        return
+    for endpoint, view in list(app.view_functions.items()):
+        if endpoint not in exclude:
+            app.view_functions[endpoint] = profiled(view, endpoint)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Replay a prediction log against the current code
+
+Every record in a log written with PREDICTION_LOG is re-run through
+KeyboardPredictor with its recorded LLM responses played back in order and
+its recorded user-dictionary matches, reranker context scores and cache hits
+restored, so the run is deterministic and needs no API key. The report
+compares results with what was recorded and compares local (non-LLM) time per
+call; --with-latency also sleeps for each recorded LLM call so end-to-end
+latency is reproduced.
+"""
+
+import argparse
+import json
+import statistics
+import time
+from types import SimpleNamespace
+
+from keyboard_predictor import KeyboardPredictor
+from llm_clients import make_response
+from phrase_cache import PhraseCache
+from reranker import Reranker
+from prediction_log import read_log
+
+
+class ReplayClient:
+    """Plays back the recorded LLM calls of one log record, in order"""
+
+    def __init__(self, calls, with_latency=False):
+        self.calls = list(calls)
+        self.with_latency = with_latency
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        if not self.calls:
+            raise RuntimeError("Replay made more LLM calls than were recorded")
+        call = self.calls.pop(0)
+        if self.with_latency:
+            time.sleep(call.get("ms", 0) / 1000)
+        if "error" in call:
+            raise RuntimeError(call["error"])
+        return make_response(call["content"], call.get("tokens"))
+
+
+class RecordedUserDictionary:
+    """Returns the user-dictionary matches captured in a log record"""
+
+    def __init__(self, matches):
+        self.matches = [tuple(match) for match in matches]
+
+    def lookup(self, user_id, button_sequence, groups):
+        return self.matches
+
+    def record(self, user_id, word):
+        pass
+
+
+class RecordedBigrams:
+    """Returns the reranker context scores captured in a log record"""
+
+    def __init__(self, scores):
+        self.scores = scores
+
+    def score(self, previous, word):
+        return self.scores.get(word, 0.0)
+
+    def observe(self, previous, word, count=1):
+        pass
+
+
+class RecordedWordCache:
+    """Answers every word-cache lookup with the candidates a log record got from the cache"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def get(self, key):
+        return self.value
+
+    def put(self, key, value):
+        pass
+
+
+def replay_record(record, with_latency=False):
+    """Re-run one log record; returns (result, local_ms, extra_or_missing_calls)"""
+    client = ReplayClient(record.get("llm_calls", []), with_latency)
+    predictor = KeyboardPredictor(client=client)
+    predictor.groups = {int(button): letters for button, letters in record["layout"].items()}
+    predictor.model = record.get("model", predictor.model)
+    predictor.prediction_log = SimpleNamespace(enabled=False)
+    predictor.phrase_cache = None
+    predictor.word_cache = None
+    predictor.reranker = Reranker(RecordedBigrams(record.get("context_scores", {})))
+
+    inputs = record["inputs"]
+    start = time.perf_counter()
+    if record["method"] == "predict_word":
+        user_id = None
+        if record.get("user_matches"):
+            predictor.user_dictionary = RecordedUserDictionary(record["user_matches"])
+            user_id = "replay"
+        if record.get("word_cache_hit"):
+            model_words, confidence = record["word_cache_hit"]
+            predictor.word_cache = RecordedWordCache((tuple(model_words), confidence))
+        result = predictor.predict_word(inputs["button_sequence"], inputs["context_text"], user_id)
+    elif record["method"] == "predict_next_words":
+        if record.get("phrase_cache_hit"):
+            predictor.phrase_cache = PhraseCache(max_entries=1)
+            context = f"{inputs['current_text']} {inputs['current_word']}"
+            predictor.phrase_cache.put(predictor.phrase_cache.key(context), tuple(record["result"]))
+        result = predictor.predict_next_words(inputs["current_text"], inputs["current_word"])
+    else:
+        raise ValueError(f"Unknown method in log: {record['method']}")
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    recorded_llm_ms = sum(call.get("ms", 0) for call in record.get("llm_calls", []))
+    local_ms = elapsed_ms - recorded_llm_ms if with_latency else elapsed_ms
+    return result, local_ms, len(client.calls)
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def replay_log(path, with_latency=False, verbose=False):
+    """Replay every record of a log and return a summary dict"""
+    mismatches = errors = total = 0
+    recorded_local, replay_local, recorded_total = [], [], []
+
+    for record in read_log(path):
+        total += 1
+        try:
+            result, local_ms, leftover_calls = replay_record(record, with_latency)
+        except Exception as e:
+            errors += 1
+            if verbose:
+                print(f"✗ record {total}: error: {e}")
+            continue
+
+        if "result" in record and json.dumps(result, sort_keys=True) != json.dumps(record["result"], sort_keys=True):
+            mismatches += 1
+            if verbose:
+                print(f"≠ record {total} ({record['method']}): recorded {record['result']}, replayed {result}")
+        elif leftover_calls and verbose:
+            print(f"≠ record {total}: {leftover_calls} recorded LLM calls were not used")
+
+        timings = record.get("timings_ms", {})
+        recorded_local.append(timings.get("local", 0.0))
+        recorded_total.append(timings.get("total", 0.0))
+        replay_local.append(local_ms)
+
+    return {
+        "records": total,
+        "mismatches": mismatches,
+        "errors": errors,
+        "recorded_local_ms_p50": round(statistics.median(recorded_local), 3) if recorded_local else 0.0,
+        "recorded_local_ms_p95": round(_percentile(recorded_local, 0.95), 3),
+        "replay_local_ms_p50": round(statistics.median(replay_local), 3) if replay_local else 0.0,
+        "replay_local_ms_p95": round(_percentile(replay_local, 0.95), 3),
+        "recorded_total_ms_p50": round(statistics.median(recorded_total), 3) if recorded_total else 0.0,
+        "recorded_total_ms_p95": round(_percentile(recorded_total, 0.95), 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("log", help="prediction log (JSONL) written with PREDICTION_LOG")
+    parser.add_argument("--with-latency", action="store_true", help="sleep for each recorded LLM call")
+    parser.add_argument("--json", metavar="PATH", help="also write the summary as JSON to PATH")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every mismatch")
+    args = parser.parse_args()
+
+    summary = replay_log(args.log, args.with_latency, args.verbose)
+    print("-" * 50)
+    for name, value in summary.items():
+        print(f"{name:<24} {value}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
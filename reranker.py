@@ -0,0 +1,163 @@
+"""
+Local re-ranking of word candidates
+
+Candidates for a button sequence come from several sources: the model, the
+name and lexicon indexes, and the user's own vocabulary. Instead of trusting
+one source's order (or putting names first whenever the context mentions a
+name), every candidate gets a score from a few cheap features and the list is
+sorted by it:
+    - model rank: 1 / (1 + position in the model's answer)
+    - frequency: log-scaled corpus frequency from the name/lexicon index
+    - context: P(word | previous word) from bigrams of accepted text
+    - user: the user's decayed score for the word (frequency and recency)
+    - name context: the word is a name and the context introduces one
+    - agreement: how many sources proposed the word
+
+Scoring is plain arithmetic on small dicts, a few microseconds per candidate.
+"""
+
+import math
+import os
+import re
+import threading
+
+WORD_RE = re.compile(r"[A-Za-z']+")
+
+DEFAULT_WEIGHTS = {
+    "model_rank": 1.0,
+    "frequency": 0.6,
+    "context": 1.5,
+    "user": 2.0,
+    "name_context": 1.2,
+    "agreement": 0.3,
+}
+
+
+def previous_word(text):
+    """Return the last word of a text, uppercased, or '' if there is none"""
+    words = WORD_RE.findall(text[-64:])
+    return words[-1].upper() if words else ""
+
+
+class BigramModel:
+    """
+    Counts of (previous word, word) pairs from text users accepted, shared by
+    all users. When it holds more than max_pairs pairs, every count is halved
+    and pairs that drop to zero are forgotten, so old phrasing fades out.
+    """
+
+    def __init__(self, max_pairs=200000):
+        self.max_pairs = max_pairs
+        self._counts = {}
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def observe(self, previous, word, count=1):
+        if not previous or not word:
+            return
+        pair = (previous.upper(), word.upper())
+        with self._lock:
+            self._counts[pair] = self._counts.get(pair, 0) + count
+            self._totals[pair[0]] = self._totals.get(pair[0], 0) + count
+            if len(self._counts) > self.max_pairs:
+                self._age()
+
+    def _age(self):
+        self._counts = {pair: n // 2 for pair, n in self._counts.items() if n > 1}
+        self._totals = {}
+        for (previous, _), n in self._counts.items():
+            self._totals[previous] = self._totals.get(previous, 0) + n
+
+    def score(self, previous, word):
+        """Return P(word | previous) from the observed pairs (0.0 if unseen)"""
+        total = self._totals.get(previous)
+        if not total:
+            return 0.0
+        return self._counts.get((previous, word), 0) / total
+
+    def load(self, path):
+        """Add counts from a file of "PREVIOUS WORD COUNT" lines"""
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) == 3 and fields[2].isdigit():
+                    self.observe(fields[0], fields[1], int(fields[2]))
+
+
+class Reranker:
+    def __init__(self, bigrams=None, weights=None):
+        self.bigrams = bigrams if bigrams is not None else BigramModel()
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+
+    def rank(self, model=(), lexicon=(), names=(), user=(), context_text="", name_context=False, trace=None):
+        """
+        Merge candidates from every source and return them best first.
+
+        Args:
+            model: words from the model, in the model's order
+            lexicon, names: (word, frequency) pairs from the indexes
+            user: (word, score) pairs from the user dictionary
+            context_text: text typed before the word
+            name_context: how strongly the context suggests a name follows,
+                          from 0 (or False) to 1 (or True)
+            trace: if a dict, the non-zero context scores are stored in it
+                   under "context_scores" (see prediction_log)
+        """
+        features = {}
+
+        def candidate(word):
+            entry = features.get(word)
+            if entry is None:
+                entry = features[word] = {"model_rank": 0.0, "frequency": 0, "user": 0.0,
+                                          "name": False, "sources": 0}
+            entry["sources"] += 1
+            return entry
+
+        for position, word in enumerate(dict.fromkeys(model)):
+            candidate(word)["model_rank"] = 1.0 / (1 + position)
+        for word, frequency in lexicon:
+            entry = candidate(word)
+            entry["frequency"] = max(entry["frequency"], frequency)
+        for word, frequency in names:
+            entry = candidate(word)
+            entry["frequency"] = max(entry["frequency"], frequency)
+            entry["name"] = True
+        for word, score in user:
+            candidate(word)["user"] = score / (1.0 + score)
+
+        w = self.weights
+        previous = previous_word(context_text)
+        context_scores = {word: self.bigrams.score(previous, word) for word in features} if previous else {}
+        if trace is not None:
+            trace["context_scores"] = {word: p for word, p in context_scores.items() if p}
+        scores = {}
+        for word, f in features.items():
+            scores[word] = (
+                w["model_rank"] * f["model_rank"]
+                + w["frequency"] * min(math.log10(f["frequency"] + 1) / 7, 1.0)
+                + w["context"] * context_scores.get(word, 0.0)
+                + w["user"] * f["user"]
+                + (w["name_context"] * float(name_context) if f["name"] else 0.0)
+                + w["agreement"] * (f["sources"] - 1)
+            )
+        return sorted(scores, key=scores.get, reverse=True)
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    """
+    Return the process-wide reranker; its bigram model is seeded from
+    NGRAM_PATH if set and learns from accepted words from then on
+    """
+    global _reranker
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                bigrams = BigramModel()
+                if os.getenv("NGRAM_PATH"):
+                    bigrams.load(os.getenv("NGRAM_PATH"))
+                _reranker = Reranker(bigrams)
+    return _reranker
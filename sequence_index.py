@@ -0,0 +1,236 @@
+"""
+Compact, read-only lookup tables from button sequences to words
+
+An index stores every (button key, word, frequency) entry of a word list in
+one flat buffer: two uint32 offset arrays and a uint32 frequency array
+followed by the packed keys and words, sorted by key. Lookups are a binary
+search over that buffer, so a built index is a single bytes object (or a
+read-only memory-mapped file) instead of thousands of small Python objects.
+That matters for pre-forking servers: when the index is built in the master
+before fork, or mapped from a file, every worker shares the same physical
+pages and reference counting never dirties them.
+
+Indexes are cached per process by name and layout; see shared_index().
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from array import array
+
+MAGIC = b"AKSI"
+VERSION = 2
+BYTE_ORDER_MARK = 0x01020304
+HEADER = struct.Struct("=4sIIIII")  # magic, version, byte order mark, count, keys size, words size
+
+
+def layout_signature(groups):
+    """Return a short stable identifier for a button -> letters mapping"""
+    spec = "|".join(f"{button}:{letters}" for button, letters in sorted(groups.items()))
+    return hashlib.sha1(spec.encode("ascii")).hexdigest()[:12]
+
+
+def letter_map(groups):
+    """Return a dict mapping each letter to its button number"""
+    return {letter: button for button, letters in groups.items() for letter in letters}
+
+
+def source_digest(paths):
+    """
+    Return a short identifier for the files a word list is read from: their
+    paths, sizes and modification times (None stands for a built-in list)
+    """
+    parts = []
+    for path in paths:
+        if path is None:
+            parts.append("builtin")
+            continue
+        try:
+            st = os.stat(path)
+            parts.append(f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}")
+        except OSError:
+            parts.append(f"{os.path.abspath(path)}:missing")
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:12]
+
+
+def word_key(word, letters_to_buttons):
+    """Return the button key (bytes of button numbers) for a word, or None if it cannot be typed"""
+    try:
+        return bytes(letters_to_buttons[ch] for ch in word)
+    except KeyError:
+        return None
+
+
+class SequenceIndex:
+    """Read-only map from button sequences to the words that spell them"""
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        view = memoryview(buffer)
+        magic, version, bom, count, keys_size, words_size = HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a sequence index (bad magic or version)")
+        if bom != BYTE_ORDER_MARK:
+            raise ValueError("Sequence index was built on a machine with a different byte order")
+
+        offsets_size = (count + 1) * 4
+        pos = HEADER.size
+        self._key_offsets = view[pos:pos + offsets_size].cast("I")
+        pos += offsets_size
+        self._word_offsets = view[pos:pos + offsets_size].cast("I")
+        pos += offsets_size
+        self._frequencies = view[pos:pos + count * 4].cast("I")
+        pos += count * 4
+        self._keys = view[pos:pos + keys_size]
+        pos += keys_size
+        self._words = view[pos:pos + words_size]
+        self._count = count
+
+    @classmethod
+    def build(cls, words, groups):
+        """
+        Build an index for `words` under the button layout `groups`.
+
+        `words` is either a sequence of words or a mapping of word ->
+        frequency. Words that cannot be typed on the layout are skipped and
+        duplicates keep their first position. Words sharing a key are ordered
+        by frequency (highest first) when frequencies are given and otherwise
+        keep their input order, so callers control ranking either way.
+        """
+        frequencies = words if isinstance(words, dict) else {}
+        letters_to_buttons = letter_map(groups)
+        entries = []
+        for word in dict.fromkeys(w.upper() for w in words):
+            key = word_key(word, letters_to_buttons)
+            if key:
+                frequency = min(int(frequencies.get(word, 0)), 0xFFFFFFFF)
+                entries.append((key, -frequency, word.encode("utf-8")))
+        entries.sort(key=lambda entry: entry[:2])  # stable: keeps input order within a key and frequency
+
+        key_offsets = array("I", [0])
+        word_offsets = array("I", [0])
+        for key, _, word in entries:
+            key_offsets.append(key_offsets[-1] + len(key))
+            word_offsets.append(word_offsets[-1] + len(word))
+        packed_frequencies = array("I", (-frequency for _, frequency, _ in entries))
+        keys = b"".join(key for key, _, _ in entries)
+        packed_words = b"".join(word for _, _, word in entries)
+
+        header = HEADER.pack(MAGIC, VERSION, BYTE_ORDER_MARK, len(entries), len(keys), len(packed_words))
+        return cls(header + key_offsets.tobytes() + word_offsets.tobytes() + packed_frequencies.tobytes()
+                   + keys + packed_words)
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map an index file written by save(); pages are shared between processes"""
+        with open(path, "rb") as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def save(self, path):
+        """Write the index to `path` atomically"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self._buffer)
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def nbytes(self):
+        """Size of the underlying buffer in bytes"""
+        return len(self._buffer)
+
+    def _key(self, i):
+        return self._keys[self._key_offsets[i]:self._key_offsets[i + 1]].tobytes()
+
+    def _word(self, i):
+        return str(self._words[self._word_offsets[i]:self._word_offsets[i + 1]], "utf-8")
+
+    def _lower_bound(self, key):
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _range(self, button_sequence, limit):
+        try:
+            key = bytes(button_sequence)
+        except (TypeError, ValueError):
+            return range(0)
+        start = end = self._lower_bound(key)
+        while end < self._count and self._key(end) == key and (limit is None or end - start < limit):
+            end += 1
+        return range(start, end)
+
+    def lookup(self, button_sequence, limit=None):
+        """Return the words whose key is exactly `button_sequence`, in index order"""
+        return [self._word(i) for i in self._range(button_sequence, limit)]
+
+    def lookup_frequencies(self, button_sequence, limit=None):
+        """Like lookup(), but return (word, frequency) pairs"""
+        return [(self._word(i), self._frequencies[i]) for i in self._range(button_sequence, limit)]
+
+    def items(self):
+        """Yield (button tuple, word) pairs in key order"""
+        for i in range(self._count):
+            yield tuple(self._key(i)), self._word(i)
+
+
+def _load_if_current(path):
+    """Load an index file, or return None if it is missing or in an old format"""
+    try:
+        return SequenceIndex.load(path)
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def shared_index(name, groups, build_words, sources=()):
+    """
+    Return the process-wide index `name` for layout `groups`, building it once.
+
+    `build_words` is called with no arguments to produce the word list the
+    first time the index is needed. If INDEX_DIR is set, the index is
+    memory-mapped from INDEX_DIR/<name>-<layout>-<sources>.idx, writing that
+    file first if it does not exist yet, so that separate worker processes
+    share it. `sources` lists the files the word list is read from (None for
+    a built-in list); see source_digest. Changing, adding or replacing one
+    selects a new file, so a changed word list is never served from an old
+    index. Files written by an older index format are rebuilt in place.
+    """
+    cache_key = (name, layout_signature(groups))
+    index = _indexes.get(cache_key)
+    if index is not None:
+        return index
+
+    with _indexes_lock:
+        index = _indexes.get(cache_key)
+        if index is None:
+            index_dir = os.getenv("INDEX_DIR")
+            if index_dir:
+                path = os.path.join(index_dir, f"{name}-{cache_key[1]}-{source_digest(sources)}.idx")
+                index = _load_if_current(path)
+                if index is None:
+                    os.makedirs(index_dir, exist_ok=True)
+                    SequenceIndex.build(build_words(), groups).save(path)
+                    index = SequenceIndex.load(path)
+            else:
+                index = SequenceIndex.build(build_words(), groups)
+            _indexes[cache_key] = index
+    return index
+
+
+def index_stats():
+    """Return {name-layout: (entries, bytes)} for every index built in this process"""
+    return {f"{name}-{signature}": (len(index), index.nbytes)
+            for (name, signature), index in _indexes.items()}
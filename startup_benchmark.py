@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark: measures cold import time of app.py and first-request latency
+
+Each run happens in a fresh Python process so that module caches are cold.
+By default the OpenAI client is replaced with a canned client so the numbers
+reflect our own startup cost; pass --live to go to the real API.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+
+def measure_once(live=False):
+    """Measure startup stages in the current (fresh) process, in milliseconds"""
+    timings = {}
+
+    start = time.perf_counter()
+    import app
+    timings['import_app'] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    predictor = app.get_predictor()
+    timings['create_predictor'] = (time.perf_counter() - start) * 1000
+
+    if not live:
+        from llm_clients import CannedClient
+        predictor._client = CannedClient(json.dumps({
+            "top_predictions": ["THE"],
+            "alternative_words": [],
+            "confidence": 0.9,
+            "next_words": ["END"],
+        }))
+
+    start = time.perf_counter()
+    predictor.warm_up()
+    timings['warm_up'] = (time.perf_counter() - start) * 1000
+
+    client = app.app.test_client()
+
+    start = time.perf_counter()
+    client.get('/get_state')
+    timings['first_get_state'] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    client.post('/press_button', json={'button': 2})
+    timings['first_press_button'] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    client.post('/press_button', json={'button': 4})
+    timings['second_press_button'] = (time.perf_counter() - start) * 1000
+
+    return timings
+
+
+def run_benchmark(runs=5, live=False):
+    """Run measure_once in `runs` fresh processes and return per-stage statistics"""
+    samples = []
+    for _ in range(runs):
+        cmd = [sys.executable, __file__, '--child']
+        if live:
+            cmd.append('--live')
+        output = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    results = {}
+    for stage in samples[0]:
+        values = [s[stage] for s in samples]
+        results[stage] = {
+            'median_ms': round(statistics.median(values), 2),
+            'min_ms': round(min(values), 2),
+            'max_ms': round(max(values), 2),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='number of fresh processes to sample')
+    parser.add_argument('--live', action='store_true', help='use the real OpenAI API')
+    parser.add_argument('--json', metavar='PATH', help='also write results as JSON to PATH')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure_once(live=args.live)))
+        sys.exit(0)
+
+    results = run_benchmark(runs=args.runs, live=args.live)
+
+    print(f"Startup benchmark ({args.runs} runs, {'live' if args.live else 'canned'} LLM)")
+    print("-" * 50)
+    for stage, stats in results.items():
+        print(f"{stage:<22} median {stats['median_ms']:>9.2f} ms  "
+              f"(min {stats['min_ms']:.2f}, max {stats['max_ms']:.2f})")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'runs': args.runs, 'live': args.live, 'stages': results}, f, indent=2)
@@ -0,0 +1,100 @@
+"""
+Server-side store for keyboard session state
+
+The session cookie only carries the session id and revision; the state itself
+(typed text, button sequence, predictions, prefix results) is kept here, so
+neither the cookie nor the per-request cost grows with the text.
+
+By default states are held in this process's memory, least recently used
+evicted first. When a directory is configured (STATE_DIR), each state is a
+small <session_id>.json file there instead, read on every request and
+replaced atomically on every change, so all worker processes on a node (and
+the WebSocket channel) see the same sessions. Files not written for `ttl`
+seconds are removed.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class StateStore:
+    def __init__(self, directory=None, max_entries=10000, ttl=86400.0, expire_interval=600.0):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.expire_interval = expire_interval
+        self._states = OrderedDict()  # session_id -> state, without a directory
+        self._lock = threading.Lock()
+        self._last_expiry = time.time()
+
+    @classmethod
+    def from_env(cls):
+        """Create a store configured by STATE_DIR and STATE_TTL_HOURS"""
+        return cls(
+            directory=os.getenv("STATE_DIR") or None,
+            ttl=float(os.getenv("STATE_TTL_HOURS", "24")) * 3600,
+        )
+
+    def _path(self, session_id):
+        return os.path.join(self.directory, f"{session_id}.json")
+
+    def get(self, session_id):
+        """Return a copy of the stored state of a session, or None"""
+        if not session_id or not _SESSION_ID_RE.match(session_id):
+            return None
+
+        if self.directory:
+            try:
+                with open(self._path(session_id), encoding="utf-8") as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                return None
+
+        with self._lock:
+            state = self._states.get(session_id)
+            if state is None:
+                return None
+            self._states.move_to_end(session_id)
+            return dict(state)
+
+    def put(self, state):
+        """Store a copy of a state under its session_id"""
+        session_id = state["session_id"]
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(session_id)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f, separators=(",", ":"))
+            os.replace(tmp_path, path)
+            if time.time() - self._last_expiry > self.expire_interval:
+                self.expire()
+            return
+
+        with self._lock:
+            self._states[session_id] = dict(state)
+            self._states.move_to_end(session_id)
+            while len(self._states) > self.max_entries:
+                self._states.popitem(last=False)
+
+    def expire(self):
+        """Remove state files that have not been written for `ttl` seconds"""
+        self._last_expiry = time.time()
+        cutoff = self._last_expiry - self.ttl
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith(".json") and os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
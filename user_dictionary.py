@@ -0,0 +1,212 @@
+"""
+Per-user adaptive dictionary learned from accepted words
+
+Every word a user accepts gets a score that grows with use and decays with a
+configurable half-life, so both frequent and recent vocabulary (names,
+jargon, sign-offs) rank high. Each user keeps at most `max_words` entries;
+the lowest-scoring word is dropped when the limit is reached. Words are
+stored without button keys, so one dictionary serves every layout.
+
+When a directory is configured, each user's dictionary is persisted as a
+small JSON file there: {"v": 1, "w": {"WORD": [score, last_used]}}. Changes
+are written in the background at most every `save_interval` seconds (and at
+exit), merged with the file so that processes sharing the directory don't
+drop each other's words. Files of users not seen for `expire_days` days are
+removed.
+"""
+
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+FORMAT_VERSION = 1
+_USER_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class UserDictionary:
+    def __init__(self, directory=None, max_words=500, half_life_days=14.0, max_users=1000,
+                 save_interval=30.0, expire_days=180.0):
+        self.directory = directory
+        self.max_words = max_words
+        self.half_life = half_life_days * 86400
+        self.max_users = max_users
+        self.save_interval = save_interval
+        self.expire_age = expire_days * 86400
+        self._users = OrderedDict()  # user_id -> {word: [score, last_used]}, least recently used first
+        self._dirty = {}  # user_id -> entries changed since the last save
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._saving = False
+        self._last_save = time.time()
+        self._last_expiry = 0.0
+        if directory:
+            atexit.register(self.flush)
+
+    @classmethod
+    def from_env(cls):
+        """
+        Create a dictionary configured by USER_DICT_DIR, USER_DICT_MAX_WORDS,
+        USER_DICT_HALF_LIFE_DAYS, USER_DICT_SAVE_SECONDS and USER_DICT_EXPIRE_DAYS
+        """
+        return cls(
+            directory=os.getenv("USER_DICT_DIR") or None,
+            max_words=int(os.getenv("USER_DICT_MAX_WORDS", "500")),
+            half_life_days=float(os.getenv("USER_DICT_HALF_LIFE_DAYS", "14")),
+            save_interval=float(os.getenv("USER_DICT_SAVE_SECONDS", "30")),
+            expire_days=float(os.getenv("USER_DICT_EXPIRE_DAYS", "180")),
+        )
+
+    def _decayed(self, score, last_used, now):
+        return score * 0.5 ** (max(now - last_used, 0) / self.half_life)
+
+    def _path(self, user_id):
+        return os.path.join(self.directory, f"{user_id}.json")
+
+    def _read(self, user_id):
+        """Return a user's entries from disk ({} if there are none)"""
+        if not self.directory:
+            return {}
+        try:
+            with open(self._path(user_id), encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get("v") != FORMAT_VERSION:
+            return {}
+        return {word: list(value) for word, value in data.get("w", {}).items()}
+
+    def _remember(self, user_id, entries):
+        """Keep a user's entries in memory, dropping the least recently used user if full (lock held)"""
+        self._users[user_id] = entries
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        return entries
+
+    def _entries(self, user_id):
+        """Return the in-memory entries for a user, loading them from disk if needed (lock held)"""
+        entries = self._users.get(user_id)
+        if entries is not None:
+            self._users.move_to_end(user_id)
+            return entries
+        entries = self._dirty.get(user_id)  # dropped from memory before it was saved
+        return self._remember(user_id, entries if entries is not None else self._read(user_id))
+
+    def loaded(self, user_id):
+        """Return True if a user's dictionary is in memory (lookups will not touch the disk)"""
+        return user_id in self._users
+
+    def load(self, user_id):
+        """Read a user's dictionary from disk into memory, without holding the lock while reading"""
+        if not user_id or not _USER_ID_RE.match(user_id) or user_id in self._users:
+            return
+        entries = self._read(user_id)
+        with self._lock:
+            if user_id not in self._users:
+                self._remember(user_id, self._dirty.get(user_id, entries))
+
+    def _save(self, user_id, entries):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(user_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"v": FORMAT_VERSION, "w": entries}, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def _trim(self, entries, now):
+        """Drop the lowest-scoring words until at most max_words are left"""
+        while len(entries) > self.max_words:
+            weakest = min(entries, key=lambda w: self._decayed(entries[w][0], entries[w][1], now))
+            del entries[weakest]
+        return entries
+
+    def flush(self):
+        """
+        Write the dictionaries changed since the last save, each merged with
+        its file (the more recently used entry of a word wins), then remove
+        expired files if a day has passed since the last check
+        """
+        with self._save_lock:
+            try:
+                with self._lock:
+                    pending = {user_id: dict(entries) for user_id, entries in self._dirty.items()}
+                    self._dirty.clear()
+                    self._last_save = time.time()
+
+                now = time.time()
+                for user_id, entries in pending.items():
+                    merged = self._read(user_id)
+                    for word, value in entries.items():
+                        if word not in merged or value[1] >= merged[word][1]:
+                            merged[word] = value
+                    try:
+                        self._save(user_id, self._trim(merged, now))
+                    except OSError:
+                        pass
+
+                if now - self._last_expiry > 86400:
+                    self._last_expiry = now
+                    self.expire()
+            finally:
+                self._saving = False
+
+    def expire(self):
+        """Remove the files of users who have not accepted a word for expire_days"""
+        cutoff = time.time() - self.expire_age
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith(".json") and os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def record(self, user_id, word):
+        """Record that a user accepted `word`"""
+        word = re.sub(r"[^A-Z]", "", (word or "").upper())
+        if not word or not user_id or not _USER_ID_RE.match(user_id):
+            return
+
+        now = time.time()
+        with self._lock:
+            entries = self._entries(user_id)
+            score, last_used = entries.get(word, (0.0, now))
+            entries[word] = [round(self._decayed(score, last_used, now) + 1.0, 3), int(now)]
+            self._trim(entries, now)
+
+            if not self.directory:
+                return
+            self._dirty[user_id] = entries
+            if self._saving or now - self._last_save < self.save_interval:
+                return
+            self._saving = True
+        threading.Thread(target=self.flush, name="user-dict-save", daemon=True).start()
+
+    def lookup(self, user_id, button_sequence, groups):
+        """
+        Return [(word, score)] for the user's words typed by `button_sequence`
+        on layout `groups`, highest decayed score first.
+        """
+        if not user_id or not button_sequence or not _USER_ID_RE.match(user_id):
+            return []
+
+        length = len(button_sequence)
+        now = time.time()
+        with self._lock:
+            entries = self._entries(user_id)
+            matches = []
+            for word, (score, last_used) in entries.items():
+                if len(word) != length:
+                    continue
+                if all(ch in groups.get(btn, "") for ch, btn in zip(word, button_sequence)):
+                    matches.append((word, self._decayed(score, last_used, now)))
+
+        matches.sort(key=lambda match: match[1], reverse=True)
+        return matches